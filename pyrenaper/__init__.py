@@ -1,2 +1,34 @@
-from .renaper import Renaper
-from .sid import Sid
\ No newline at end of file
+from typing import TYPE_CHECKING
+import importlib
+
+# Clients are imported on first access, so "import pyrenaper" stays cheap and only
+# the modules a program actually uses get loaded.
+_EXPORTS = {"Renaper": ".renaper",
+            "AsyncRenaper": ".async_renaper",
+            "Sid": ".sid",
+            "AsyncSid": ".async_sid",
+            "HttpTransport": ".transport",
+            "AsyncHttpTransport": ".transport",
+            "warmup": ".preload"}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .renaper import Renaper
+    from .async_renaper import AsyncRenaper
+    from .sid import Sid
+    from .async_sid import AsyncSid
+    from .transport import HttpTransport, AsyncHttpTransport
+    from .preload import warmup
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module 'pyrenaper' has no attribute '{}'".format(name))
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
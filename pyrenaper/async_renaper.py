@@ -0,0 +1,126 @@
+from typing import Optional, Callable, Dict
+from . import codec, tracing
+from .body import has_streamed_images, JsonBodyStream
+from .cache import LookupCache
+from .images import ImageCache, ImageNormalizer
+from .renaper import Renaper
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy, CircuitBreaker, acall_with_retry
+from .singleflight import SingleFlight
+from .transport import AsyncHttpTransport
+import asyncio
+import contextvars
+import time
+
+
+class AsyncRenaper(Renaper):
+    """Asyncio implementation of the Renaper API.
+
+    Exposes the same methods as Renaper (new_operation, add_front, add_back, register,
+    face_login, end_operation, scan_barcode, add_barcode, person_data) as coroutines
+    returning RenaperResponse objects. Requires httpx (pip install pyrenaper[async]).
+
+        async with AsyncRenaper(ONBOARDING, package1_apikey=KEY) as renaper:
+            response = await renaper.new_operation(number, gender, ip, fingerprint)
+    """
+
+    def __init__(self,
+                 environment: str,
+                 package1_apikey: Optional[str] = None,
+                 package2_apikey: Optional[str] = None,
+                 package3_apikey: Optional[str] = None,
+                 transport: Optional[AsyncHttpTransport] = None,
+                 image_cache: Optional[ImageCache] = None,
+                 lookup_cache: Optional[LookupCache] = None,
+                 normalizer: Optional[ImageNormalizer] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 metrics=None,
+                 tracer: Optional[tracing.Tracer] = None,
+                 single_flight: Optional[SingleFlight] = None) -> None:
+        super().__init__(environment,
+                         package1_apikey,
+                         package2_apikey,
+                         package3_apikey,
+                         transport=transport if transport is not None else AsyncHttpTransport(),
+                         image_cache=image_cache,
+                         lookup_cache=lookup_cache,
+                         normalizer=normalizer,
+                         retry_policy=retry_policy,
+                         retry_policies=retry_policies,
+                         circuit_breaker=circuit_breaker,
+                         rate_limiter=rate_limiter,
+                         metrics=metrics,
+                         tracer=tracer,
+                         single_flight=single_flight)
+        self._owns_transport = transport is None
+
+    async def _make_request(self, url: str, payload: dict, p_id: int) -> Dict:
+        cached = self._get_cached_lookup(url, payload)
+        if cached is not None:
+            return cached
+        key = self._single_flight_key(url, payload, p_id)
+        if key is not None:
+            return await self._single_flight.ado(key, lambda: self._fetch(url, payload, p_id))
+        return await self._fetch(url, payload, p_id)
+
+    async def _make_image_request(self, url: str, build_data: Callable[[], Dict], p_id: int) -> Dict:
+        # Normalization waits on the normalizer executor and file backed images are read from
+        # disk, both run on a worker thread so the event loop is never blocked. Invalid images
+        # are raised when the call is awaited.
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, contextvars.copy_context().run, self._build_image_request,
+                                          url, build_data, p_id)
+        return await self._make_request(url, data, p_id)
+
+    async def _fetch(self, url: str, payload: dict, p_id: int) -> Dict:
+        try:
+            headers = self._get_request_headers(url, p_id)
+            data = await acall_with_retry(lambda: self._send(url, payload, dict(headers), p_id),
+                                          self._get_retry_policy(url),
+                                          self._circuit_breaker)
+        except Exception as e:
+            self._record_exception(url, p_id, e)
+            raise
+        self._set_cached_lookup(url, payload, data)
+        return data
+
+    async def _send(self, url: str, payload: dict, headers: dict, p_id: int) -> Dict:
+        if self._rate_limiter is not None:
+            with tracing.span('rate_limit', tracing.WAIT):
+                await self._rate_limiter.aacquire(p_id)
+        with tracing.span('encode', tracing.LOCAL):
+            streamed = has_streamed_images(payload)
+            if streamed:
+                body = JsonBodyStream(payload)
+                size = len(body)
+                headers['Content-Length'] = str(size)
+                content = body.aiter_chunks()
+            else:
+                content = codec.dumps(payload)
+                size = len(content)
+        with tracing.span('request', tracing.NETWORK, endpoint=url, streamed=streamed) as span:
+            start = time.perf_counter()
+            request = await self._transport.post(self._env.domain, content=content, headers=headers)
+            elapsed = time.perf_counter() - start
+            span.set_attribute('http.status_code', request.status_code)
+        with tracing.span('decode', tracing.LOCAL):
+            return self._handle_response(url, p_id, request, elapsed, size)
+
+    async def close(self) -> None:
+        """
+        Releases pooled connections if the transport is owned by this client.
+        """
+        if self._owns_transport:
+            await self._transport.close()
+
+    def __enter__(self):
+        raise TypeError("AsyncRenaper must be used with 'async with'")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
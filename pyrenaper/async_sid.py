@@ -0,0 +1,153 @@
+from typing import Optional, Dict, Iterable, List, Tuple
+from .cache import LookupCache
+from .exceptions import SidAuthenticationException
+from .retry import RetryPolicy, CircuitBreaker, acall_with_retry
+from .sid import Sid
+from .singleflight import SingleFlight
+from .transport import AsyncHttpTransport
+import asyncio
+
+
+class AsyncSid(Sid):
+    """Asyncio implementation of the Renaper SID API.
+
+    Lookups run as coroutines sharing a single auth token, so many porDniSexo.php /
+    porDniSexoTramite.php requests can be in flight at once over one connection pool.
+    Requires httpx (pip install pyrenaper[async]).
+
+        async with AsyncSid(SID, username, password) as sid:
+            results = await sid.get_many_full_person_data(people, concurrency=20)
+    """
+    _async_token_lock = None
+
+    def __init__(self, env: str, username: str, password: str,
+                 transport: Optional[AsyncHttpTransport] = None,
+                 lookup_cache: Optional[LookupCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 single_flight: Optional[SingleFlight] = None) -> None:
+        super().__init__(env, username, password,
+                         transport=transport if transport is not None else AsyncHttpTransport(),
+                         lookup_cache=lookup_cache,
+                         retry_policy=retry_policy,
+                         circuit_breaker=circuit_breaker,
+                         single_flight=single_flight)
+        self._owns_transport = transport is None
+
+    async def _make_request(self, url: str, payload: dict=None,
+                            headers: dict=None, http_method: str='GET') -> Dict:
+        return await acall_with_retry(lambda: self._send(url, payload, headers, http_method),
+                                      self._get_retry_policy(url),
+                                      self._circuit_breaker)
+
+    async def _send(self, url: str, payload: dict=None,
+                    headers: dict=None, http_method: str='GET') -> Dict:
+        if http_method == 'POST':
+            request = await self._transport.post(self.build_url(url),
+                                                 data=payload,
+                                                 headers=headers)
+        else:
+            request = await self._transport.get(self.build_url(url),
+                                                params=payload,
+                                                headers=headers)
+        return self._parse_response(request)
+
+    def _get_auth_headers(self, token: Optional[str] = None):
+        return {"Authorization": " ".join(("Bearer", token))}
+
+    def _get_token_lock(self) -> asyncio.Lock:
+        if self._async_token_lock is None:
+            self._async_token_lock = asyncio.Lock()
+        return self._async_token_lock
+
+    async def _get_valid_token(self) -> str:
+        token = self._valid_token()
+        if token is not None:
+            return token
+        async with self._get_token_lock():
+            token = self._valid_token()
+            if token is None:
+                token = await self.get_token(self._credentials)
+                self._set_token(token)
+            return token
+
+    async def _invalidate_token(self, token: str) -> None:
+        async with self._get_token_lock():
+            if self._token == token:
+                self._token_state = (None, 0.0)
+
+    async def _authorized_request(self, url: str, params: dict) -> Dict:
+        token = await self._get_valid_token()
+        try:
+            return await self._make_request(url, params, http_method='GET',
+                                            headers=self._get_auth_headers(token))
+        except SidAuthenticationException:
+            await self._invalidate_token(token)
+            token = await self._get_valid_token()
+            return await self._make_request(url, params, http_method='GET',
+                                            headers=self._get_auth_headers(token))
+
+    async def login(self):
+        async with self._get_token_lock():
+            self._set_token(await self.get_token(self._credentials))
+
+    async def get_token(self, credentials) -> str:
+        token_data = await self._make_request("CHUTROFINAL/API_ABIS/Autorizacion/token.php",
+                                              credentials, http_method='POST')
+        return token_data['token']
+
+    async def _lookup(self, url: str, params: dict) -> Dict:
+        cached = self._get_cached_lookup(url, params)
+        if cached is not None:
+            return cached
+        key = self._single_flight_key(url, params)
+        if key is not None:
+            return await self._single_flight.ado(key, lambda: self._fetch(url, params))
+        return await self._fetch(url, params)
+
+    async def _fetch(self, url: str, params: dict) -> Dict:
+        person_data = await self._authorized_request(url, params)
+        self._set_cached_lookup(url, params, person_data)
+        return person_data
+
+    async def get_many_basic_person_data(self,
+                                         people: Iterable[Tuple[str, str]],
+                                         concurrency: Optional[int] = 10) -> List:
+        """
+        Runs get_basic_person_data for every (person_id, gender) tuple concurrently.
+        :(list) return: results in input order, failed lookups are returned as their exception.
+        """
+        return await self._gather(self.get_basic_person_data, people, concurrency)
+
+    async def get_many_full_person_data(self,
+                                        people: Iterable[Tuple[str, str, str]],
+                                        concurrency: Optional[int] = 10) -> List:
+        """
+        Runs get_full_person_data for every (person_id, gender, operation_id) tuple concurrently.
+        :(list) return: results in input order, failed lookups are returned as their exception.
+        """
+        return await self._gather(self.get_full_person_data, people, concurrency)
+
+    async def _gather(self, method, items: Iterable[Tuple], concurrency: int) -> List:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(args):
+            async with semaphore:
+                return await method(*args)
+
+        await self._get_valid_token()
+        return await asyncio.gather(*(run(args) for args in items), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Releases pooled connections if the transport is owned by this client."""
+        if self._owns_transport:
+            await self._transport.close()
+
+    def __enter__(self):
+        raise TypeError("AsyncSid must be used with 'async with'")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -0,0 +1,135 @@
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Callable, Iterable, Iterator, AsyncIterator, Tuple
+from .models import BatchResult, BatchProgress
+from .settings import BATCH_SETTINGS
+import asyncio
+
+
+def _normalize_key(key: Tuple) -> Tuple:
+    try:
+        number, gender, order = key
+    except (TypeError, ValueError):
+        raise ValueError('Batch items must be (number, gender, order) tuples, got {!r}'.format(key))
+    if number is None or gender is None or order is None:
+        raise ValueError('Batch item {!r} is missing a field'.format(key))
+    return str(number).strip(), str(gender).strip().upper(), str(order).strip()
+
+
+def _unique(items: Iterable[Tuple], counters: dict) -> Iterator[Tuple]:
+    """
+    Yields (key, error) pairs, error is the ValueError of malformed keys, which are not deduplicated.
+    """
+    seen = set()
+    for key in items:
+        try:
+            normalized = _normalize_key(key)
+        except ValueError as e:
+            yield key, e
+            continue
+        if normalized in seen:
+            counters['duplicates'] += 1
+            continue
+        seen.add(normalized)
+        yield key, None
+
+
+def _failed_future(error: Exception, future=None):
+    future = future if future is not None else Future()
+    future.set_exception(error)
+    return future
+
+
+def _progress(counters: dict) -> BatchProgress:
+    return BatchProgress(counters['submitted'], counters['completed'], counters['failed'], counters['duplicates'])
+
+
+def bulk_person_data(renaper,
+                     items: Iterable[Tuple],
+                     concurrency: Optional[int] = None,
+                     on_progress: Optional[Callable[[BatchProgress], None]] = None) -> Iterator[BatchResult]:
+    """
+    Runs Renaper.person_data for every (number, gender, order) tuple in items.
+    Duplicated keys are only requested once, items are consumed lazily so items can be a stream.
+    Results are yielded as they finish, exceptions are reported in BatchResult.error without aborting the batch,
+    malformed items get a ValueError.
+    :(Renaper) renaper: client with a package 3 api key.
+    :(iterable) items: (number, gender, order) tuples.
+    :(int) concurrency: maximum amount of requests in flight, defaults to BATCH_SETTINGS concurrency.
+    :(callable) on_progress: called with a BatchProgress after every finished item.
+    :(iterator) return: BatchResult(key, response, error) objects.
+    """
+    concurrency = concurrency or BATCH_SETTINGS['concurrency']
+    counters = dict(submitted=0, completed=0, failed=0, duplicates=0)
+    keys = _unique(items, counters)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                item = next(keys, None)
+                if item is None:
+                    exhausted = True
+                    break
+                key, error = item
+                future = executor.submit(renaper.person_data, *key) if error is None else _failed_future(error)
+                pending[future] = key
+                counters['submitted'] += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                counters['completed'] += 1
+                try:
+                    result = BatchResult(key, future.result(), None)
+                except Exception as e:
+                    counters['failed'] += 1
+                    result = BatchResult(key, None, e)
+                if on_progress:
+                    on_progress(_progress(counters))
+                yield result
+
+
+async def abulk_person_data(renaper,
+                            items: Iterable[Tuple],
+                            concurrency: Optional[int] = None,
+                            on_progress: Optional[Callable[[BatchProgress], None]] = None) -> AsyncIterator[BatchResult]:
+    """
+    Asyncio version of bulk_person_data, to be used with an AsyncRenaper client.
+    """
+    concurrency = concurrency or BATCH_SETTINGS['concurrency']
+    counters = dict(submitted=0, completed=0, failed=0, duplicates=0)
+    keys = _unique(items, counters)
+    pending = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                item = next(keys, None)
+                if item is None:
+                    exhausted = True
+                    break
+                key, error = item
+                if error is None:
+                    task = asyncio.ensure_future(renaper.person_data(*key))
+                else:
+                    task = _failed_future(error, asyncio.get_running_loop().create_future())
+                pending[task] = key
+                counters['submitted'] += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = pending.pop(task)
+                counters['completed'] += 1
+                try:
+                    result = BatchResult(key, task.result(), None)
+                except Exception as e:
+                    counters['failed'] += 1
+                    result = BatchResult(key, None, e)
+                if on_progress:
+                    on_progress(_progress(counters))
+                yield result
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,232 @@
+"""Microbenchmarks for the client hot paths.
+
+    python -m pyrenaper.benchmarks --output results.json
+    python -m pyrenaper.benchmarks --compare baseline.json --threshold 0.2
+
+Results are written as JSON, times are seconds per call. With --compare the run exits
+with status 1 when a benchmark is slower than the baseline by more than threshold.
+"""
+from typing import Optional, Dict, List, Callable
+from . import codec
+from .body import JsonBodyStream
+from .images import RawImage
+from .models import RenaperResponse, Selfie
+from .renaper import Renaper
+from .environments import ONBOARDING
+from .pdf417 import parse_barcodes
+from .mocks.images import document_image, selfie_image
+from .settings import DOCUMENT_FORMAT_SETTINGS, SELFIE_FORMAT_SETTINGS, APPLICATION_VERSION
+import argparse
+import base64
+import platform
+import statistics
+import sys
+import timeit
+
+BENCHMARKS = {}
+
+SHORT_BARCODE = '00123456789@PEREZ@JUAN CARLOS@M@12345678@A@01/02/1980@15/06/2015@200'
+LONG_BARCODE = '@12345678    @A@1@PEREZ@JUAN CARLOS@ARGENTINA@01/02/1980@M@15/06/2015@00123456789@7055 @15/06/2030@421@0@ILR:2.01 C:110927.01 (No Cap.)@UNIDAD #02 || S/N: 0040>2008>>0006'
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark. The decorated function prepares its inputs and returns the
+    zero argument callable to be timed.
+    """
+    def decorator(setup: Callable[[], Callable]):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _client() -> Renaper:
+    return Renaper(ONBOARDING, package1_apikey='benchmark')
+
+
+def _selfies() -> List[Selfie]:
+    selfie = base64.b64encode(selfie_image()).decode()
+    return [Selfie(selfie, image_type) for image_type in ['SN', 'SS', 'SCE', 'SBL', 'SBR']]
+
+
+def _end_operation_payload(anomalies: int = 200) -> Dict:
+    person = {"names": "JUAN CARLOS", "lastNames": "PEREZ", "birthDate": "1980-02-01",
+              "cuil": "20123456789", "address": {"street": "CALLE FALSA", "number": "123", "city": "CABA"}}
+    return {"code": 903,
+            "message": "Operacion finalizada",
+            "operationId": 123456,
+            "number": "12345678",
+            "gender": "M",
+            "confidence": 0.98,
+            "anomalies": codec.dumps([{"area": "area{}".format(i), "score": i / anomalies, "result": "OK"}
+                                      for i in range(anomalies)]).decode('utf-8'),
+            "ocr": {"number": "12345678", "names": "JUAN CARLOS", "lastNames": "PEREZ",
+                    "extra": {"additional": codec.dumps({"field{}".format(i): "value" for i in range(50)}).decode(),
+                              "mrz": codec.dumps({"line{}".format(i): "<" * 30 for i in range(3)}).decode()}},
+            "personData": {"person": codec.dumps(person).decode('utf-8')}}
+
+
+@benchmark('validate_image_document')
+def validate_image_document():
+    renaper, image = _client(), base64.b64encode(document_image()).decode()
+    return lambda: renaper._validate_image(image, DOCUMENT_FORMAT_SETTINGS)
+
+
+@benchmark('validate_image_selfie')
+def validate_image_selfie():
+    renaper, image = _client(), base64.b64encode(selfie_image()).decode()
+    return lambda: renaper._validate_image(image, SELFIE_FORMAT_SETTINGS)
+
+
+@benchmark('validate_image_document_raw')
+def validate_image_document_raw():
+    renaper, image = _client(), RawImage(document_image())
+    return lambda: renaper._validate_image(image, DOCUMENT_FORMAT_SETTINGS)
+
+
+@benchmark('check_selfie_format_5')
+def check_selfie_format():
+    renaper, selfies = _client(), _selfies()
+    return lambda: renaper._check_selfie_format(selfies)
+
+
+@benchmark('parse_barcode_short')
+def parse_barcode_short():
+    renaper = _client()
+    return lambda: renaper._parse_barcode(SHORT_BARCODE)
+
+
+@benchmark('parse_barcode_long')
+def parse_barcode_long():
+    renaper = _client()
+    return lambda: renaper._parse_barcode(LONG_BARCODE)
+
+
+@benchmark('parse_barcodes_1000')
+def parse_barcodes_1000():
+    lines = [SHORT_BARCODE + '\n', LONG_BARCODE + '\n'] * 500
+    return lambda: parse_barcodes(lines)
+
+
+@benchmark('response_end_operation')
+def response_end_operation():
+    payload = _end_operation_payload()
+    return lambda: RenaperResponse(payload, ['END_OPERATION_OK'])
+
+
+@benchmark('response_end_operation_decoded')
+def response_end_operation_decoded():
+    body = codec.dumps(_end_operation_payload())
+    return lambda: RenaperResponse(codec.loads(body), ['END_OPERATION_OK']).response
+
+
+@benchmark('serialize_register_body')
+def serialize_register_body():
+    renaper, selfies = _client(), _selfies()
+    payload = {"operationId": 1, "number": 12345678, "gender": "M",
+               "selfieList": renaper._check_selfie_format(selfies)}
+    return lambda: codec.dumps(payload)
+
+
+@benchmark('stream_register_body')
+def stream_register_body():
+    selfie = selfie_image()
+    payload = {"operationId": 1, "number": 12345678, "gender": "M",
+               "selfieList": [{"file": RawImage(selfie), "imageType": "SN"} for _ in range(5)]}
+
+    def run():
+        for _ in JsonBodyStream(payload):
+            pass
+    return run
+
+
+def run(names: Optional[List[str]] = None, repeat: int = 5, min_time: float = 0.2) -> Dict:
+    """
+    Runs benchmarks.
+    :(list) names: benchmarks to run, all of them by default
+    :(int) repeat: timing rounds per benchmark
+    :(float) min_time: minimum seconds per round, the loop count is calibrated to reach it
+    :(dict) return: machine readable results, seconds per call
+    """
+    results = {}
+    for name in names or sorted(BENCHMARKS):
+        timer = timeit.Timer(BENCHMARKS[name]())
+        number, elapsed = timer.autorange()
+        if elapsed < min_time:
+            number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+        timings = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+        results[name] = {"min": min(timings),
+                         "mean": statistics.mean(timings),
+                         "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                         "loops": number,
+                         "repeat": repeat}
+    return {"version": APPLICATION_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "codec": codec.get_codec().name,
+            "benchmarks": results}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.2) -> List[Dict]:
+    """
+    Compares best timings against a baseline.
+    :(dict) results: output of run
+    :(dict) baseline: saved output of run
+    :(float) threshold: allowed slowdown ratio, 0.2 means 20% slower
+    :(list) return: one entry per benchmark present in both, flagged as regression when slower than threshold
+    """
+    comparison = []
+    for name, result in sorted(results['benchmarks'].items()):
+        if name not in baseline.get('benchmarks', {}):
+            continue
+        before = baseline['benchmarks'][name]['min']
+        change = result['min'] / before - 1 if before else 0.0
+        comparison.append({"name": name,
+                           "baseline": before,
+                           "current": result['min'],
+                           "change": change,
+                           "regression": change > threshold})
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='pyrenaper microbenchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(sorted(BENCHMARKS)))
+        return 0
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    results = run(args.names, repeat=args.repeat, min_time=args.min_time)
+    output = codec.dumps(results).decode('utf-8')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'rb') as baseline_file:
+            comparison = compare(results, codec.loads(baseline_file.read()), args.threshold)
+        for entry in comparison:
+            print('{:32} {:>12.3e} {:>12.3e} {:>+8.1%}{}'.format(entry['name'], entry['baseline'], entry['current'],
+                                                                entry['change'],
+                                                                '  REGRESSION' if entry['regression'] else ''),
+                  file=sys.stderr)
+        if any(entry['regression'] for entry in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from typing import List, Iterator
+from . import codec
+from .images import RawImage, IMAGE_CHUNK_SIZE
+
+
+def has_streamed_images(payload) -> bool:
+    """
+    Checks whether payload contains RawImage values that have to be streamed.
+    """
+    if isinstance(payload, RawImage):
+        return True
+    if isinstance(payload, dict):
+        return any(has_streamed_images(value) for value in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return any(has_streamed_images(value) for value in payload)
+    return False
+
+
+def _flatten(payload, parts: List) -> None:
+    if isinstance(payload, RawImage):
+        parts.append(payload)
+    elif isinstance(payload, dict):
+        parts.append(b'{')
+        for i, (key, value) in enumerate(payload.items()):
+            parts.append((b',' if i else b'') + codec.dumps(str(key)) + b':')
+            _flatten(value, parts)
+        parts.append(b'}')
+    elif isinstance(payload, (list, tuple)):
+        parts.append(b'[')
+        for i, value in enumerate(payload):
+            if i:
+                parts.append(b',')
+            _flatten(value, parts)
+        parts.append(b']')
+    else:
+        parts.append(codec.dumps(payload))
+
+
+class JsonBodyStream:
+    """JSON request body whose RawImage values are base64 encoded while the body is sent.
+
+    Only one image chunk is kept in memory at a time. The body length is known in advance so it
+    is sent with a Content-Length header. Works as a file-like object (requests), use
+    aiter_chunks for async clients (httpx). Each JsonBodyStream can only be sent once, build a new one to retry.
+    """
+
+    def __init__(self, payload, chunk_size: int = IMAGE_CHUNK_SIZE) -> None:
+        parts = []
+        _flatten(payload, parts)
+        self._parts = []
+        for part in parts:
+            if isinstance(part, bytes) and self._parts and isinstance(self._parts[-1], bytes):
+                self._parts[-1] += part
+            else:
+                self._parts.append(part)
+        self._chunk_size = chunk_size
+        self._chunks = None
+        self._buffer = b''
+
+    def __len__(self) -> int:
+        return sum(part.base64_size + 2 if isinstance(part, RawImage) else len(part) for part in self._parts)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if isinstance(part, RawImage):
+                yield b'"'
+                yield from part.iter_base64(self._chunk_size)
+                yield b'"'
+            else:
+                yield part
+
+    async def aiter_chunks(self):
+        for chunk in self:
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if self._chunks is None:
+            self._chunks = iter(self)
+        if size is None or size < 0:
+            data, self._buffer = self._buffer + b''.join(self._chunks), b''
+            return data
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from . import codec
+from .settings import LOOKUP_CACHE_SETTINGS
+import hashlib
+import json
+import threading
+import time
+
+
+class MemoryCacheBackend:
+    """In-process LRU backend for LookupCache, shared between threads."""
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        self.max_entries = max_entries if max_entries is not None else LOOKUP_CACHE_SETTINGS['max_entries']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """SQLite file backend for LookupCache, shared between threads and worker processes."""
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, timeout: Optional[float] = 5.0) -> None:
+        self.path = path
+        self.max_entries = max_entries if max_entries is not None else LOOKUP_CACHE_SETTINGS['max_entries']
+        self._timeout = timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS lookup_cache '
+                               '(key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS lookup_cache_accessed_at ON lookup_cache (accessed_at)')
+
+    def _connection(self) -> 'sqlite3.Connection':
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=self._timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute('SELECT value, expires_at FROM lookup_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                connection.execute('DELETE FROM lookup_cache WHERE key = ?', (key,))
+                return None
+            connection.execute('UPDATE lookup_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO lookup_cache (key, value, expires_at, accessed_at) '
+                               'VALUES (?, ?, ?, ?)', (key, value, now + ttl, now))
+            connection.execute('DELETE FROM lookup_cache WHERE key IN (SELECT key FROM lookup_cache '
+                               'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute('DELETE FROM lookup_cache WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        with self._connection() as connection:
+            connection.execute('DELETE FROM lookup_cache')
+
+
+class LookupCache:
+    """TTL cache for identity lookups (Renaper.person_data, Sid person data).
+
+    Values are stored serialized, so every hit returns a fresh copy of the original payload.
+    Only successful responses should be stored, error payloads are skipped by the clients.
+
+        cache = LookupCache(ttl=3600)
+        cache = LookupCache(SQLiteCacheBackend('/tmp/pyrenaper.sqlite'), ttl=3600)
+    """
+
+    def __init__(self, backend=None, ttl: Optional[float] = None) -> None:
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl if ttl is not None else LOOKUP_CACHE_SETTINGS['ttl']
+
+    @staticmethod
+    def key(namespace: str, params: Dict) -> str:
+        raw = json.dumps([namespace, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, namespace: str, params: Dict) -> Optional[Any]:
+        value = self.backend.get(self.key(namespace, params))
+        if value is None:
+            return None
+        return codec.loads(value)
+
+    def set(self, namespace: str, params: Dict, value: Any) -> None:
+        self.backend.set(self.key(namespace, params), codec.dumps(value).decode('utf-8'), self.ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
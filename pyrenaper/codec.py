@@ -0,0 +1,90 @@
+from typing import Any, Optional, Union
+from .settings import JSON_BACKENDS
+import json
+
+
+class StdlibJsonCodec:
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self._orjson.loads(data)
+
+
+class UjsonCodec:
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._ujson.dumps(obj, escape_forward_slashes=False, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self._ujson.loads(data)
+
+
+CODECS = {OrjsonCodec.name: OrjsonCodec,
+          UjsonCodec.name: UjsonCodec,
+          StdlibJsonCodec.name: StdlibJsonCodec}
+
+_codec = None
+
+
+def load_codec(names=None):
+    """
+    Returns the first importable codec in names, defaults to JSON_BACKENDS preference.
+    The stdlib codec is always available as last resort, unknown names raise ValueError.
+    """
+    names = names or JSON_BACKENDS
+    for name in names:
+        if name not in CODECS:
+            raise ValueError('Unknown JSON codec {}, should be one of: {}'.format(name, ', '.join(CODECS)))
+    for name in names:
+        try:
+            return CODECS[name]()
+        except ImportError:
+            continue
+    return StdlibJsonCodec()
+
+
+def use(name: Optional[str] = None):
+    """
+    Sets the JSON codec used for request serialization and response parsing.
+    :(str) name: one of CODECS, falls back to the stdlib codec if it is not installed.
+    Raises ValueError for names not in CODECS.
+    """
+    global _codec
+    _codec = load_codec([name] if name else None)
+    return _codec
+
+
+def get_codec():
+    if _codec is None:
+        return use()
+    return _codec
+
+
+def dumps(obj: Any) -> bytes:
+    return get_codec().dumps(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return get_codec().loads(data)
@@ -1,18 +1,60 @@
+from collections.abc import Awaitable
 from functools import wraps
 from .models import RenaperResponse
+from . import tracing
 import os
-import uuid
 
 def api_call_wrapper(valid_status):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            data = f(*args, **kwargs)
-            return RenaperResponse(data, valid_status)
+            step = tracing.span(f.__name__, tracing.INTERNAL, tracer=getattr(args[0], '_tracer', None),
+                                package=kwargs.get('package_id'))
+            token = tracing.activate(step)
+            try:
+                data = f(*args, **kwargs)
+            except Exception as e:
+                step.end(e)
+                raise
+            finally:
+                tracing.deactivate(token)
+            if isinstance(data, Awaitable):
+                return _async_response(data, valid_status, step)
+            return _end_step(step, RenaperResponse(data, valid_status))
         return wrapper
     return decorator
 
 
+async def _async_response(data, valid_status, step):
+    token = tracing.activate(step)
+    try:
+        response = RenaperResponse(await data, valid_status)
+    except Exception as e:
+        step.end(e)
+        raise
+    finally:
+        tracing.deactivate(token)
+    return _end_step(step, response)
+
+
+def _end_step(step, response):
+    """
+    Tags the step span with the response code, the operation id is copied to the
+    enclosing operation span so every step of an onboarding can be linked by it.
+    """
+    if step is tracing.NOOP_SPAN:
+        return response
+    operation_id = response.get('operationId')
+    step.set_attribute('renaper.code', response.code)
+    step.set_attribute('renaper.status', response.status)
+    step.set_attribute('operation_id', operation_id)
+    parent = getattr(step, 'parent', None)
+    if parent is not None and operation_id is not None:
+        parent.attributes.setdefault('operation_id', operation_id)
+    step.end()
+    return response
+
+
 
 def package_id(package_id):
     def decorator(f):
@@ -25,6 +67,7 @@ def package_id(package_id):
 
 def clean_files(func):
     def wrapper(self, data, format):
+        import uuid
         image_name= str(uuid.uuid4())
         try:
             data = func(self, data, image_name, format)
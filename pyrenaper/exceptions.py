@@ -51,6 +51,26 @@ class IncorrectBarcodeException(BaseRenaperException):
     default_message = "Barcode does not belong to a valid ID."
 
 
+class BarcodeBackendNotFoundException(BaseRenaperException):
+    default_message = "No barcode decoding backend installed, install zxing-cpp or zxing."
+
+
+class SidAuthenticationException(BaseRenaperException):
+    default_message = "SID token was rejected."
+
+
+class ServerErrorException(BaseRenaperException):
+    default_message = "Server error returned."
+
+
+class CircuitOpenException(BaseRenaperException):
+    default_message = "Service unavailable, circuit breaker is open."
+
+
+class RateLimitExceededException(BaseRenaperException):
+    default_message = "Rate limit for package exceeded."
+
+
 class ApiKeyForPackageNotFoundException(Exception):
     def __init__(self, message, *args, **kwargs):
         super().__init__('Please provide an api key for Package {}'.format(str(message)))
@@ -0,0 +1,227 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, List, Set
+from .models import OnboardingResult, step_succeeded
+from .operations import OperationStore
+from .settings import EXPIRED_OPERATION_STATUS
+from . import tracing
+import asyncio
+import contextvars
+import time
+
+
+class OnboardingFlow:
+    """Runs a full onboarding against a Renaper (or AsyncRenaper) client.
+
+    new_operation is executed first, then the front, back, selfie (and optional barcode)
+    uploads run concurrently since they only depend on the operation id, and finally
+    end_operation closes the validation. The flow stops at the first response that is not
+    a success for its step (STEP_SUCCESS_STATUS), pending uploads are cancelled and
+    end_operation is skipped.
+    When the client has a tracer, the whole flow is recorded as an 'onboarding' span
+    with one child span per step.
+    With a store, progress is saved per (number, gender, fingerprint) and a new run for the
+    same person resumes the stored operation, skipping the steps that already succeeded.
+    The stored operation is dropped once end_operation succeeds or when RENAPER reports it
+    as unknown or expired.
+
+        flow = OnboardingFlow(renaper)
+        flow = OnboardingFlow(renaper, store=OperationStore())
+        result = flow.run(number, gender, ip, fingerprint, front, back, selfie_list)
+    """
+
+    def __init__(self, renaper, max_workers: Optional[int] = 4, store: Optional[OperationStore] = None) -> None:
+        self._renaper = renaper
+        self._max_workers = max_workers
+        self._store = store
+
+    def _upload_steps(self,
+                      operation_id: int,
+                      number: int,
+                      gender: str,
+                      front: str,
+                      back: str,
+                      selfie_list: List,
+                      document_data: Optional[Dict] = None,
+                      analyze_anomalies: Optional[bool] = False,
+                      analyze_ocr: Optional[bool] = False) -> Dict:
+        steps = {"add_front": (self._renaper.add_front, (operation_id, number, gender, front),
+                               {"analyze_anomalies": analyze_anomalies, "analyze_ocr": analyze_ocr}),
+                 "add_back": (self._renaper.add_back, (operation_id, number, gender, back),
+                              {"analyze_anomalies": analyze_anomalies, "analyze_ocr": analyze_ocr}),
+                 "register": (self._renaper.register, (operation_id, gender, number, selfie_list), {})}
+        if document_data is not None:
+            steps["add_barcode"] = (self._renaper.add_barcode, (operation_id, number, gender, document_data), {})
+        return steps
+
+    def _resume(self, result: OnboardingResult, number: int, gender: str, fingerprint: str) -> Set[str]:
+        """
+        Loads the stored progress of the person into result, returns the names of the completed steps.
+        """
+        state = self._store.get(number, gender, fingerprint) if self._store is not None else None
+        if state is None:
+            return set()
+        result.operation_id = state['operation_id']
+        steps = {name: OperationStore.response(step) for name, step in state['steps'].items()
+                 if name != 'end_operation'}
+        steps = {name: response for name, response in steps.items() if step_succeeded(name, response)}
+        for name, response in steps.items():
+            result.add_step(name, response, 0.0)
+            result.resumed.append(name)
+        return set(steps)
+
+    def _save(self, result: OnboardingResult, number: int, gender: str, fingerprint: str, name: str) -> None:
+        if self._store is None:
+            return
+        response = result.steps[name].response
+        if not step_succeeded(name, response):
+            # Answers that are not a success for the step (HTTP 200 ones included) are never stored.
+            if not response.status and response.code_description in EXPIRED_OPERATION_STATUS:
+                self._store.delete(number, gender, fingerprint)
+        elif name == 'new_operation':
+            self._store.start(number, gender, fingerprint, result.operation_id, response)
+        elif name == 'end_operation':
+            self._store.delete(number, gender, fingerprint)
+        else:
+            self._store.add_step(number, gender, fingerprint, name, response)
+
+    def _operation_span(self):
+        return tracing.span('onboarding', tracing.INTERNAL, tracer=getattr(self._renaper, '_tracer', None))
+
+    def _timed(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        return response, time.perf_counter() - start
+
+    async def _atimed(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = await func(*args, **kwargs)
+        return response, time.perf_counter() - start
+
+    def run(self,
+            number: int,
+            gender: str,
+            ip: str,
+            browser_fingerprint: str,
+            front: str,
+            back: str,
+            selfie_list: List,
+            document_data: Optional[Dict] = None,
+            analyze_anomalies: Optional[bool] = False,
+            analyze_ocr: Optional[bool] = False) -> OnboardingResult:
+        """
+        Executes the onboarding flow.
+        :(int) number: Government ID number
+        :(str) gender: Must be M / F
+        :(str) ip: Ip address of client performing API request
+        :(str) browser_fingerprint: Fingerprint provided by Renaper's JS library.
+        :(base64 image) front: Image of front of ID
+        :(base64 image) back: Image of back of ID
+        :(list) selfie_list: List of Selfie objects
+        :(dict) document_data: Optional document data returned by scan_barcode, uploaded with add_barcode.
+        :(OnboardingResult) return: Combined result with timing for each step.
+        """
+        with self._operation_span():
+            return self._run(number, gender, ip, browser_fingerprint, front, back, selfie_list,
+                             document_data, analyze_anomalies, analyze_ocr)
+
+    def _run(self, number, gender, ip, browser_fingerprint, front, back, selfie_list,
+             document_data, analyze_anomalies, analyze_ocr) -> OnboardingResult:
+        result = OnboardingResult()
+        start = time.perf_counter()
+        try:
+            completed = self._resume(result, number, gender, browser_fingerprint)
+            if result.operation_id is None:
+                response, elapsed = self._timed(self._renaper.new_operation, number, gender, ip, browser_fingerprint)
+                result.add_step('new_operation', response, elapsed)
+                if result.failed_step:
+                    return result
+                result.operation_id = response.response['operationId']
+                self._save(result, number, gender, browser_fingerprint, 'new_operation')
+
+            steps = self._upload_steps(result.operation_id, number, gender, front, back, selfie_list,
+                                       document_data, analyze_anomalies, analyze_ocr)
+            steps = {name: step for name, step in steps.items() if name not in completed}
+            executor = ThreadPoolExecutor(max_workers=self._max_workers)
+            # Each upload runs in a copy of the current context to keep its span under the operation.
+            pending = {executor.submit(contextvars.copy_context().run, self._timed, func, *args, **kwargs): name
+                       for name, (func, args, kwargs) in steps.items()}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = pending.pop(future)
+                        response, elapsed = future.result()
+                        result.add_step(name, response, elapsed)
+                        self._save(result, number, gender, browser_fingerprint, name)
+                    if result.failed_step:
+                        return result
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+            response, elapsed = self._timed(self._renaper.end_operation, result.operation_id, number, gender)
+            result.add_step('end_operation', response, elapsed)
+            self._save(result, number, gender, browser_fingerprint, 'end_operation')
+            return result
+        finally:
+            result.elapsed = time.perf_counter() - start
+
+    async def arun(self,
+                   number: int,
+                   gender: str,
+                   ip: str,
+                   browser_fingerprint: str,
+                   front: str,
+                   back: str,
+                   selfie_list: List,
+                   document_data: Optional[Dict] = None,
+                   analyze_anomalies: Optional[bool] = False,
+                   analyze_ocr: Optional[bool] = False) -> OnboardingResult:
+        """
+        Asyncio version of run, to be used with an AsyncRenaper client.
+        """
+        with self._operation_span():
+            return await self._arun(number, gender, ip, browser_fingerprint, front, back, selfie_list,
+                                    document_data, analyze_anomalies, analyze_ocr)
+
+    async def _arun(self, number, gender, ip, browser_fingerprint, front, back, selfie_list,
+                    document_data, analyze_anomalies, analyze_ocr) -> OnboardingResult:
+        result = OnboardingResult()
+        start = time.perf_counter()
+        try:
+            completed = self._resume(result, number, gender, browser_fingerprint)
+            if result.operation_id is None:
+                response, elapsed = await self._atimed(self._renaper.new_operation, number, gender, ip,
+                                                       browser_fingerprint)
+                result.add_step('new_operation', response, elapsed)
+                if result.failed_step:
+                    return result
+                result.operation_id = response.response['operationId']
+                self._save(result, number, gender, browser_fingerprint, 'new_operation')
+
+            steps = self._upload_steps(result.operation_id, number, gender, front, back, selfie_list,
+                                       document_data, analyze_anomalies, analyze_ocr)
+            steps = {name: step for name, step in steps.items() if name not in completed}
+            pending = {asyncio.ensure_future(self._atimed(func, *args, **kwargs)): name
+                       for name, (func, args, kwargs) in steps.items()}
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        name = pending.pop(task)
+                        response, elapsed = task.result()
+                        result.add_step(name, response, elapsed)
+                        self._save(result, number, gender, browser_fingerprint, name)
+                    if result.failed_step:
+                        return result
+            finally:
+                for task in pending:
+                    task.cancel()
+
+            response, elapsed = await self._atimed(self._renaper.end_operation, result.operation_id, number, gender)
+            result.add_step('end_operation', response, elapsed)
+            self._save(result, number, gender, browser_fingerprint, 'end_operation')
+            return result
+        finally:
+            result.elapsed = time.perf_counter() - start
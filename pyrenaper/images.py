@@ -0,0 +1,368 @@
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, List
+from io import BytesIO
+from .exceptions import InvalidImage
+from .settings import IMAGE_CACHE_SETTINGS, IMAGE_NORMALIZATION_SETTINGS
+import base64
+import binascii
+import hashlib
+import os
+import re
+import threading
+
+# Start Of Frame markers carrying the image size, DHT (C4), JPG (C8) and DAC (CC) are excluded.
+JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                              0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+# Markers without a length field.
+JPEG_STANDALONE_MARKERS = frozenset((0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7))
+# Amount of decoded bytes inspected on each attempt, the SOF marker usually sits in the
+# first KB but EXIF/ICC segments can push it up to a few hundred KB.
+JPEG_HEADER_READ_SIZES = (2048, 16384, 131072, 524288)
+
+# Raw image chunk size, multiple of 3 so every chunk base64 encodes without padding.
+IMAGE_CHUNK_SIZE = 3 * 16384
+# Signatures used to tell raw image bytes apart from base64 encoded bytes.
+RAW_IMAGE_SIGNATURES = (b'\xff\xd8', b'\x89PNG', b'GIF8', b'BM', b'II*\x00', b'MM\x00*', b'RIFF')
+
+_NON_BASE64_CHARS = re.compile(rb'[^A-Za-z0-9+/]')
+
+
+class RawImage:
+    """Image provided as raw bytes, memoryview, file path or binary file object.
+
+    The image is never base64 encoded as a whole: its header is read for validation and
+    the payload is base64 encoded chunk by chunk while the request body is streamed.
+    Seekable file objects are rewound to their initial position on every read.
+    """
+
+    def __init__(self, source) -> None:
+        self._path = None
+        self._file = None
+        self._data = None
+        if isinstance(source, os.PathLike):
+            self._path = os.fspath(source)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = memoryview(source).cast('B')
+        elif hasattr(source, 'read'):
+            if hasattr(source, 'seekable') and source.seekable():
+                self._file = source
+                self._start = source.tell()
+            else:
+                self._data = memoryview(source.read())
+        else:
+            raise TypeError('Unsupported image source {}'.format(type(source).__name__))
+
+    @property
+    def size(self) -> int:
+        if self._data is not None:
+            return len(self._data)
+        if self._path is not None:
+            return os.path.getsize(self._path)
+        end = self._file.seek(0, os.SEEK_END)
+        self._file.seek(self._start)
+        return end - self._start
+
+    def iter_chunks(self, chunk_size: int = IMAGE_CHUNK_SIZE):
+        if self._data is not None:
+            for position in range(0, len(self._data), chunk_size):
+                yield self._data[position:position + chunk_size]
+            return
+        if self._path is not None:
+            with open(self._path, 'rb') as image_file:
+                yield from iter(lambda: image_file.read(chunk_size), b'')
+            return
+        self._file.seek(self._start)
+        yield from iter(lambda: self._file.read(chunk_size), b'')
+
+    def head(self, size: int) -> bytes:
+        return bytes(next(self.iter_chunks(size), b''))
+
+    def read(self) -> bytes:
+        if self._data is not None:
+            return self._data.tobytes()
+        return b''.join(self.iter_chunks())
+
+    def iter_base64(self, chunk_size: int = IMAGE_CHUNK_SIZE):
+        for chunk in self.iter_chunks(chunk_size):
+            yield base64.b64encode(chunk)
+
+    @property
+    def base64_size(self) -> int:
+        return (self.size + 2) // 3 * 4
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state['_data'] is not None:
+            state['_data'] = state['_data'].tobytes()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._data is not None:
+            self._data = memoryview(self._data)
+
+    def __repr__(self):
+        return 'RawImage({})'.format(self._path or '{} bytes'.format(self.size))
+
+
+def as_image_source(image):
+    """
+    Wraps raw images (bytes with an image signature, bytearray, memoryview, os.PathLike paths
+    and file objects) in a RawImage. base64 str/bytes images are returned unchanged.
+    """
+    if isinstance(image, (RawImage, str)):
+        return image
+    if isinstance(image, bytes) and not image.startswith(RAW_IMAGE_SIGNATURES):
+        return image
+    return RawImage(image)
+
+
+def image_bytes(image) -> bytes:
+    """
+    Raw bytes of a base64 image or RawImage.
+    """
+    if isinstance(image, RawImage):
+        return image.read()
+    return base64.b64decode(image)
+
+
+class TruncatedHeader(Exception):
+    pass
+
+
+def read_jpeg_size(data: bytes) -> Tuple[int, int]:
+    """
+    Reads width and height from the SOF segment of a JPEG header.
+    :(bytes) data: leading bytes of a JPEG file.
+    :(tuple) return: (width, height)
+    Raises TruncatedHeader if data ends before the SOF segment and ValueError if data is not a JPEG.
+    """
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('Not a JPEG image')
+    position = 2
+    size = len(data)
+    while True:
+        if position + 4 > size:
+            raise TruncatedHeader
+        if data[position] != 0xFF:
+            raise ValueError('Invalid JPEG marker')
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError('JPEG image has no frame header')
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > size:
+                raise TruncatedHeader
+            height = int.from_bytes(data[position + 5:position + 7], 'big')
+            width = int.from_bytes(data[position + 7:position + 9], 'big')
+            return width, height
+        position += 2 + length
+
+
+def _decode_prefix(image, decoded_size: int) -> Tuple[bytes, bool]:
+    """
+    Base64 decodes only the leading bytes of image.
+    :(tuple) return: decoded bytes and whether the whole image was decoded.
+    """
+    if isinstance(image, str):
+        image = image.encode('ascii')
+    encoded_size = (decoded_size // 3) * 4
+    chunk = _NON_BASE64_CHARS.sub(b'', image[:encoded_size])
+    complete = encoded_size >= len(image)
+    if not complete:
+        chunk = chunk[:len(chunk) // 4 * 4]
+    return base64.b64decode(chunk + b'=' * (-len(chunk) % 4)), complete
+
+
+def _read_prefix(image, size: int) -> Tuple[bytes, bool]:
+    if isinstance(image, RawImage):
+        data = image.head(size)
+        return data, len(data) < size
+    return _decode_prefix(image, size)
+
+
+def get_jpeg_info(image) -> Optional[Tuple[str, int, int]]:
+    """
+    Fast path: reads format and size of a JPEG decoding only its header.
+    :(base64 image) image: str or bytes base64 encoded image, or a RawImage.
+    :(tuple) return: ('jpeg', width, height) or None if image is not a JPEG with a readable header.
+    """
+    for read_size in JPEG_HEADER_READ_SIZES:
+        try:
+            data, complete = _read_prefix(image, read_size)
+            width, height = read_jpeg_size(data)
+        except TruncatedHeader:
+            if complete:
+                return None
+            continue
+        except (ValueError, UnicodeEncodeError, binascii.Error):
+            return None
+        else:
+            return 'jpeg', width, height
+    return None
+
+
+def get_image_info(image) -> Tuple[str, int, int]:
+    """
+    Returns (format, width, height) of a base64 encoded image or RawImage.
+    JPEG headers are parsed directly, other images fall back to Pillow.
+    """
+    info = get_jpeg_info(image)
+    if info is not None:
+        return info
+    from PIL import Image
+    pil_image = Image.open(BytesIO(image_bytes(image)))
+    return pil_image.format.lower(), pil_image.width, pil_image.height
+
+
+def settings_key(settings: Dict) -> Tuple:
+    """
+    Hashable representation of an image format settings dict.
+    """
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value)
+                        for key, value in settings.items()))
+
+
+class ImageCache:
+    """Bounded LRU cache of image normalization results.
+
+    Entries are keyed by a digest of the image payload, the format settings and the
+    normalizer options, so retried uploads and the same image sent to several methods are
+    only normalized once. Stored values are the normalized base64 payloads.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self.maxsize = maxsize if maxsize is not None else IMAGE_CACHE_SETTINGS['maxsize']
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(image) -> bytes:
+        if isinstance(image, RawImage):
+            digest = hashlib.blake2b(b'raw', digest_size=20)
+            for chunk in image.iter_chunks():
+                digest.update(chunk)
+            return digest.digest()
+        if isinstance(image, str):
+            image = image.encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(image, digest_size=20).digest()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def info(self) -> Dict:
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize}
+
+
+def _target_size(width: int, height: int, settings: Dict) -> Tuple[Optional[Tuple[int, int]], bool]:
+    """
+    Size an image should be resized to in order to match settings (None if it already fits),
+    and whether it has to be cropped to reach an exact size.
+    """
+    if settings.get('min_height') is not None and \
+            settings['min_length'] == settings['max_length'] and settings['min_height'] == settings['max_height']:
+        size = (settings['max_length'], settings['max_height'])
+        return (None if size == (width, height) else size), True
+    target_width = settings.get('recommended_length', settings['max_length'])
+    if width <= target_width:
+        return None, False
+    return (target_width, max(1, round(height * target_width / width))), False
+
+
+def normalize_image(image, settings: Dict, quality: Optional[int] = None) -> str:
+    """
+    Fixes EXIF orientation, resizes image to fit settings and re-encodes it as JPEG.
+    Fixed size settings (selfies) are center cropped to the exact size, other images are
+    downsized to recommended_length (or max_length) keeping their aspect ratio.
+    :(base64 image) image: base64 encoded image or RawImage
+    :(dict) settings: Image format settings.
+    :(int) quality: JPEG quality, defaults to IMAGE_NORMALIZATION_SETTINGS quality.
+    :(str) return: base64 encoded JPEG
+    """
+    from PIL import Image, ImageOps
+    quality = quality if quality is not None else IMAGE_NORMALIZATION_SETTINGS['quality']
+    try:
+        pil_image = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes(image))))
+    except Exception:
+        raise InvalidImage('Not able to parse provided image')
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    size, crop = _target_size(pil_image.width, pil_image.height, settings)
+    if size is not None:
+        if crop:
+            pil_image = ImageOps.fit(pil_image, size, Image.LANCZOS)
+        else:
+            pil_image = pil_image.resize(size, Image.LANCZOS)
+    buffer = BytesIO()
+    pil_image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class ImageNormalizer:
+    """Optional normalization stage run before images are validated and uploaded.
+
+    Images are resized, re-oriented and re-encoded with normalize_image on an executor,
+    a thread pool by default. Pass a ProcessPoolExecutor to spread the work across cores.
+    """
+
+    def __init__(self, quality: Optional[int] = None, executor=None, workers: Optional[int] = None) -> None:
+        self.quality = quality if quality is not None else IMAGE_NORMALIZATION_SETTINGS['quality']
+        self._owns_executor = executor is None
+        if executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=workers or IMAGE_NORMALIZATION_SETTINGS['workers'])
+        self._executor = executor
+
+    @property
+    def cache_key(self) -> Tuple:
+        """
+        Options changing the normalized output, part of the ImageCache keys.
+        """
+        return type(self).__name__, self.quality
+
+    def normalize(self, image, settings: Dict) -> str:
+        return self._executor.submit(normalize_image, image, settings, self.quality).result()
+
+    def normalize_many(self, images: List, settings: Dict) -> List[str]:
+        futures = [self._executor.submit(normalize_image, image, settings, self.quality) for image in images]
+        return [future.result() for future in futures]
+
+    def close(self) -> None:
+        if self._owns_executor:
+            self._executor.shutdown()
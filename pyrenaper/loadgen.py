@@ -0,0 +1,164 @@
+"""Load generator for end to end throughput tests against the stub server.
+
+    python -m pyrenaper.loadgen onboarding --concurrency 16 --operations 500 --latency 0.05
+    python -m pyrenaper.loadgen sid --url http://127.0.0.1:8099/ --concurrency 32
+
+Without --url an in process mocks.server.StubServer is started with the given latency and
+error rate. Prints throughput and percentile latencies as JSON.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable
+from .flow import OnboardingFlow
+from .mocks.images import document_image, selfie_image
+from .mocks.server import StubServer
+from .models import Environment, Selfie
+from .renaper import Renaper
+from .retry import RetryPolicy, NO_RETRY
+from .sid import Sid
+from .transport import HttpTransport
+from . import codec
+import argparse
+import base64
+import math
+import sys
+import time
+
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    """
+    Registers a scenario. The decorated function receives the onboarding and SID
+    environments, a shared transport and the retry policy, and returns a callable
+    running one operation that returns whether it succeeded.
+    """
+    def decorator(build: Callable):
+        SCENARIOS[name] = build
+        return build
+    return decorator
+
+
+def _renaper(onboarding: Environment, transport: HttpTransport, retry_policy: RetryPolicy) -> Renaper:
+    return Renaper(onboarding, package1_apikey='load', package2_apikey='load', package3_apikey='load',
+                   transport=transport, retry_policy=retry_policy)
+
+
+@scenario('onboarding')
+def onboarding_scenario(onboarding, sid, transport, retry_policy):
+    flow = OnboardingFlow(_renaper(onboarding, transport, retry_policy))
+    document = base64.b64encode(document_image()).decode()
+    selfies = [Selfie(base64.b64encode(selfie_image()).decode(), 'SN')]
+    return lambda i: flow.run(10000000 + i, 'M', '127.0.0.1', 'fingerprint', document, document, selfies).status
+
+
+@scenario('face_login')
+def face_login_scenario(onboarding, sid, transport, retry_policy):
+    renaper = _renaper(onboarding, transport, retry_policy)
+    selfies = [Selfie(base64.b64encode(selfie_image()).decode(), 'SN')]
+    return lambda i: renaper.face_login(10000000 + i, 'M', selfies, 'fingerprint').status
+
+
+@scenario('person_data')
+def person_data_scenario(onboarding, sid, transport, retry_policy):
+    renaper = _renaper(onboarding, transport, retry_policy)
+    return lambda i: renaper.person_data(10000000 + i, 'M', '00123456789').status
+
+
+@scenario('sid')
+def sid_scenario(onboarding, sid, transport, retry_policy):
+    client = Sid(sid, 'load', 'load', transport=transport, retry_policy=retry_policy)
+    return lambda i: client.get_full_person_data(str(10000000 + i), 'M', '00123456789').get('codigo') == 0
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(math.ceil(percent / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def run_load(operation: Callable[[int], bool], operations: int, concurrency: int) -> Dict:
+    """
+    Runs operation operations times from concurrency threads.
+    :(callable) operation: receives the operation number, returns whether it succeeded
+    :(int) operations: total operations
+    :(int) concurrency: worker threads
+    :(dict) return: throughput, errors by type and latency percentiles in seconds
+    """
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            error = None if operation(i) else 'failed'
+        except Exception as e:
+            error = type(e).__name__
+        return time.perf_counter() - start, error
+
+    latencies, errors = [], Counter()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed, error in executor.map(timed, range(operations)):
+            latencies.append(elapsed)
+            if error:
+                errors[error] += 1
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"operations": operations,
+            "concurrency": concurrency,
+            "elapsed": elapsed,
+            "throughput": operations / elapsed if elapsed else 0.0,
+            "succeeded": operations - sum(errors.values()),
+            "errors": dict(errors),
+            "latency": {"mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                        "p50": percentile(latencies, 50),
+                        "p90": percentile(latencies, 90),
+                        "p95": percentile(latencies, 95),
+                        "p99": percentile(latencies, 99),
+                        "max": latencies[-1] if latencies else 0.0}}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='pyrenaper load generator')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--url', help='stub server url, an in process stub is started if missing')
+    parser.add_argument('--latency', type=float, default=0.0, help='in process stub latency')
+    parser.add_argument('--jitter', type=float, default=0.0, help='in process stub latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='in process stub error rate')
+    parser.add_argument('--no-retry', action='store_true', help='disable retries of idempotent calls')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        url = args.url if args.url.endswith('/') else args.url + '/'
+        onboarding = Environment(base_url=url + 'vu-onboarding-rest/', domain=url)
+        sid = Environment(base_url=url, domain=url)
+    else:
+        server = StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+        onboarding, sid = server.onboarding_environment, server.sid_environment
+
+    transport = HttpTransport(pool_maxsize=args.concurrency * 4)
+    try:
+        operation = SCENARIOS[args.scenario](onboarding, sid, transport, NO_RETRY if args.no_retry else RetryPolicy())
+        results = dict(run_load(operation, args.operations, args.concurrency), scenario=args.scenario)
+    finally:
+        transport.close()
+        if server is not None:
+            server.stop()
+
+    output = codec.dumps(results).decode('utf-8')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
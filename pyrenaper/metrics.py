@@ -0,0 +1,170 @@
+from bisect import bisect_left
+from typing import Optional, Dict, List
+from .settings import METRICS_SETTINGS, STATUS_CODES, DOCUMENT_FORMAT_SETTINGS, PDF417_FORMAT_SETTINGS, \
+    SELFIE_FORMAT_SETTINGS
+import threading
+
+REQUEST_DURATION = 'pyrenaper_request_duration_seconds'
+REQUEST_SIZE = 'pyrenaper_request_size_bytes'
+RESPONSE_SIZE = 'pyrenaper_response_size_bytes'
+HTTP_RESPONSES = 'pyrenaper_http_responses_total'
+API_CODES = 'pyrenaper_api_codes_total'
+VALIDATION_DURATION = 'pyrenaper_image_validation_duration_seconds'
+EXCEPTIONS = 'pyrenaper_exceptions_total'
+
+DESCRIPTIONS = {REQUEST_DURATION: 'Time spent on each HTTP request attempt.',
+                REQUEST_SIZE: 'Size of request bodies.',
+                RESPONSE_SIZE: 'Size of response bodies.',
+                HTTP_RESPONSES: 'HTTP responses by status code.',
+                API_CODES: 'RENAPER responses by code.',
+                VALIDATION_DURATION: 'Time spent validating images before upload.',
+                EXCEPTIONS: 'Exceptions raised by client calls.'}
+
+
+def code_name(data: Dict) -> Optional[str]:
+    """
+    Returns the STATUS_CODES name of a RENAPER payload code, the raw code if unknown.
+    """
+    if isinstance(data.get('error'), dict):
+        data = data['error']
+    code = data.get('code')
+    if code is None:
+        return None
+    return STATUS_CODES.get(code, str(code))
+
+
+def image_kind(settings: Dict) -> str:
+    """
+    Returns the label used for validation metrics of an image format settings dict.
+    """
+    if settings is DOCUMENT_FORMAT_SETTINGS:
+        return 'document'
+    if settings is PDF417_FORMAT_SETTINGS:
+        return 'barcode'
+    if settings is SELFIE_FORMAT_SETTINGS:
+        return 'selfie'
+    return 'custom'
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, Prometheus style."""
+
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List:
+        total, result = 0, []
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class InMemoryMetrics:
+    """Default metrics sink, keeps counters and histograms in process memory.
+
+    Any object implementing increment(name, labels, value) and observe(name, labels, value)
+    can be used as a sink instead, e.g. to forward values to statsd or prometheus_client.
+    Histograms whose name ends with _bytes use size buckets, the rest use latency buckets.
+
+        metrics = InMemoryMetrics()
+        renaper = Renaper(ONBOARDING, package1_apikey=KEY, metrics=metrics)
+        print(metrics.to_prometheus())
+    """
+
+    def __init__(self,
+                 latency_buckets: Optional[List[float]] = None,
+                 size_buckets: Optional[List[float]] = None) -> None:
+        self.latency_buckets = latency_buckets or METRICS_SETTINGS['latency_buckets']
+        self.size_buckets = size_buckets or METRICS_SETTINGS['size_buckets']
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: Dict) -> tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, labels: Dict, value: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, labels: Dict, value: float) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                buckets = self.size_buckets if name.endswith('_bytes') else self.latency_buckets
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(name, {}).get(self._key(labels), 0)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self.histograms.get(name, {}).get(self._key(labels))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        return prometheus_text(self)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    labels = key + extra
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def prometheus_text(metrics: InMemoryMetrics) -> str:
+    """
+    Renders an InMemoryMetrics sink in the Prometheus text exposition format.
+    :(InMemoryMetrics) metrics: sink to render
+    :(str) return: exposition text, serve it with content type text/plain; version=0.0.4
+    """
+    lines = []
+    with metrics._lock:
+        for name in sorted(metrics.counters):
+            if name in DESCRIPTIONS:
+                lines.append('# HELP {} {}'.format(name, DESCRIPTIONS[name]))
+            lines.append('# TYPE {} counter'.format(name))
+            for key, value in sorted(metrics.counters[name].items()):
+                lines.append('{}{} {}'.format(name, _format_labels(key), _format_value(value)))
+        for name in sorted(metrics.histograms):
+            if name in DESCRIPTIONS:
+                lines.append('# HELP {} {}'.format(name, DESCRIPTIONS[name]))
+            lines.append('# TYPE {} histogram'.format(name))
+            for key, histogram in sorted(metrics.histograms[name].items()):
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{} {}'.format(name, _format_labels(key, (('le', _format_value(bound)),)),
+                                                         count))
+                lines.append('{}_sum{} {}'.format(name, _format_labels(key), repr(histogram.sum)))
+                lines.append('{}_count{} {}'.format(name, _format_labels(key), histogram.count))
+    return '\n'.join(lines) + '\n'
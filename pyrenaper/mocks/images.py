@@ -0,0 +1,23 @@
+from io import BytesIO
+from pyrenaper.settings import DOCUMENT_FORMAT_SETTINGS, SELFIE_FORMAT_SETTINGS
+
+
+def jpeg(width: int, height: int, quality: int = 90) -> bytes:
+    """
+    Generates a JPEG image of the given size, requires Pillow.
+    """
+    from PIL import Image
+    output = BytesIO()
+    image = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    image.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def document_image() -> bytes:
+    """Front/back document image with the recommended width."""
+    return jpeg(DOCUMENT_FORMAT_SETTINGS['recommended_length'], 760)
+
+
+def selfie_image() -> bytes:
+    """Selfie image matching SELFIE_FORMAT_SETTINGS."""
+    return jpeg(SELFIE_FORMAT_SETTINGS['max_length'], SELFIE_FORMAT_SETTINGS['max_height'])
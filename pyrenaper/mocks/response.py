@@ -1,3 +1,6 @@
+import json
+
+
 class MockResponse:
     def __init__(self, json_data, status_code):
         self.json_data = json_data
@@ -5,3 +8,41 @@ class MockResponse:
 
     def json(self):
         return self.json_data
+
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode()
+
+
+class MockTransport:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.closed = False
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.pop(0)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncMockTransport(MockTransport):
+    async def request(self, method, url, **kwargs):
+        return MockTransport.request(self, method, url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def close(self):
+        self.closed = True
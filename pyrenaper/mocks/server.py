@@ -0,0 +1,275 @@
+"""Local stub of the RENAPER onboarding/face/information API and the SID API.
+
+    python -m pyrenaper.mocks.server --port 8099 --latency 0.05 --error-rate 0.01
+
+or in process:
+
+    with StubServer(latency=0.05) as server:
+        renaper = Renaper(server.onboarding_environment, package1_apikey='key')
+        sid = Sid(server.sid_environment, 'user', 'password')
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict
+from urllib.parse import urlsplit, parse_qs
+from pyrenaper.models import Environment
+from pyrenaper.settings import STATUS_CODES
+import argparse
+import base64
+import itertools
+import json
+import random
+import threading
+import time
+
+CODES = {name: code for code, name in STATUS_CODES.items()}
+
+SID_TOKEN_URL = 'CHUTROFINAL/API_ABIS/Autorizacion/token.php'
+SID_BASIC_URL = 'apidatos/porDniSexo.php'
+SID_FULL_URL = 'apidatos/porDniSexoTramite.php'
+
+PERSON = {"names": "JUAN CARLOS", "lastNames": "PEREZ", "birthDate": "1980-02-01", "cuil": "20123456789"}
+
+
+def _message(code_name: str, **extra) -> Dict:
+    return dict({"code": CODES[code_name], "message": code_name}, **extra)
+
+
+def _new_operation(server, body):
+    return _message('NEW_OPERATION_OK', operationId=server.next_operation_id())
+
+
+def _end_operation(server, body):
+    return _message('END_OPERATION_OK', operationId=body.get('operationId'), number=body.get('number'),
+                    gender=body.get('gender'), confidence=0.98, anomalies=json.dumps([]),
+                    personData={"person": json.dumps(PERSON)})
+
+
+def _face_login(server, body):
+    return _message('FACE_COMPARE_OK', confidence=0.97, number=body.get('number'))
+
+
+def _person_data(server, body):
+    return _message('RENAPER_OK_EXITO', personData={"person": json.dumps(dict(PERSON, number=body.get('number')))})
+
+
+def _scan_barcode(server, body):
+    return _message('BARCODE_SCAN_OK', document={"number": "12345678", "gender": "M", "order": "00123456789"})
+
+
+ONBOARDING_ROUTES = {'onboarding/newOperation': _new_operation,
+                     'onboarding/addFront': lambda server, body: _message('ADD_FRONT_OK'),
+                     'onboarding/addBack': lambda server, body: _message('ADD_BACK_OK'),
+                     'onboarding/register': lambda server, body: _message('ADD_SELFIES_OK'),
+                     'onboarding/addBarcode': lambda server, body: _message('ADD_BARCODE_OK'),
+                     'onboarding/scanBarcode': _scan_barcode,
+                     'onboarding/endOperation': _end_operation,
+                     'face/login': _face_login,
+                     'information/personData': _person_data,
+                     'status': lambda server, body: {"status": "UP"}}
+
+
+class StubServer:
+    """Threaded HTTP server answering like the RENAPER and SID APIs.
+
+    latency (plus a random 0..jitter) is slept before every answer and error_rate of the
+    requests are answered with error_status. endpoints overrides those values per endpoint,
+    a status_code entry answers every request of the endpoint with that status:
+
+        StubServer(latency=0.02, endpoints={'onboarding/register': {"latency": 0.4},
+                                            'information/personData': {"status_code": 444}})
+
+    Renaper requests need an apiKey header (511 otherwise) and SID lookups a token issued
+    by the stub (401 otherwise).
+    """
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 error_status: int = 500,
+                 endpoints: Optional[Dict[str, Dict]] = None,
+                 token_ttl: int = 3600,
+                 seed: Optional[int] = None) -> None:
+        self.defaults = {"latency": latency, "jitter": jitter, "error_rate": error_rate,
+                         "error_status": error_status, "status_code": None}
+        self.endpoints = endpoints or {}
+        self.token_ttl = token_ttl
+        self.counts = {}
+        self._random = random.Random(seed)
+        self._operation_ids = itertools.count(1)
+        self._tokens = set()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    @property
+    def onboarding_environment(self) -> Environment:
+        return Environment(base_url=self.url + 'vu-onboarding-rest/', domain=self.url)
+
+    @property
+    def sid_environment(self) -> Environment:
+        return Environment(base_url=self.url, domain=self.url)
+
+    def behavior(self, endpoint: str) -> Dict:
+        return dict(self.defaults, **self.endpoints.get(endpoint, {}))
+
+    def next_operation_id(self) -> int:
+        with self._lock:
+            return next(self._operation_ids)
+
+    def record(self, endpoint: str) -> None:
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def issue_token(self) -> str:
+        claims = json.dumps({"exp": int(time.time()) + self.token_ttl}).encode()
+        token = '.'.join(base64.urlsafe_b64encode(part).decode().rstrip('=')
+                         for part in (b'{"alg":"none"}', claims, b'stub'))
+        with self._lock:
+            self._tokens.add(token)
+        return token
+
+    def valid_token(self, token: str) -> bool:
+        with self._lock:
+            return token in self._tokens
+
+    def revoke_tokens(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle would delay keep-alive answers.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, data: Dict) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _simulate(self, endpoint: str) -> Optional[int]:
+        """
+        Sleeps the configured latency, returns the error status to answer with, if any.
+        """
+        stub = self.server.stub
+        stub.record(endpoint)
+        behavior = stub.behavior(endpoint)
+        delay = behavior['latency'] + behavior['jitter'] * stub.random()
+        if delay:
+            time.sleep(delay)
+        if behavior['status_code']:
+            return behavior['status_code']
+        if behavior['error_rate'] and stub.random() < behavior['error_rate']:
+            return behavior['error_status']
+        return None
+
+    def do_POST(self):
+        raw = self._read_body()
+        path = urlsplit(self.path).path.lstrip('/')
+        if path == SID_TOKEN_URL:
+            return self._sid_token(raw)
+        url = self.headers.get('url', '')
+        endpoint = next((route for route in ONBOARDING_ROUTES if url.endswith(route)), None)
+        if endpoint is None:
+            return self._send_json(404, {"code": CODES['INCORRECT_PARAMETERS'], "message": "Unknown endpoint"})
+        status = self._simulate(endpoint)
+        if status:
+            return self._send_json(status, {"code": status})
+        if not self.headers.get('apiKey'):
+            return self._send_json(511, {"message": "Api key is not valid"})
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            return self._send_json(400, _message('INCORRECT_PARAMETERS'))
+        self._send_json(200, ONBOARDING_ROUTES[endpoint](self.server.stub, body))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.lstrip('/')
+        if path not in (SID_BASIC_URL, SID_FULL_URL):
+            return self._send_json(404, {"codigo": 404, "mensaje": "Not found"})
+        status = self._simulate(path)
+        if status:
+            return self._send_json(status, {"codigo": status})
+        token = self.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not self.server.stub.valid_token(token):
+            return self._send_json(401, {"codigo": 401, "mensaje": "Token invalido"})
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        data = {"codigo": 0, "mensaje": "OK", "dni": params.get('dni'), "sexo": params.get('sexo'),
+                "nombres": PERSON['names'], "apellido": PERSON['lastNames'],
+                "fecha_nacimiento": PERSON['birthDate'], "cuil": PERSON['cuil']}
+        if path == SID_FULL_URL:
+            data["id_tramite_principal"] = params.get('idtramite')
+        self._send_json(200, data)
+
+    def _sid_token(self, raw: bytes):
+        status = self._simulate(SID_TOKEN_URL)
+        if status:
+            return self._send_json(status, {"codigo": status})
+        credentials = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+        if not credentials.get('username') or not credentials.get('password'):
+            return self._send_json(401, {"codigo": 401, "mensaje": "Credenciales invalidas"})
+        self._send_json(200, {"codigo": 0, "token": self.server.stub.issue_token()})
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='RENAPER/SID stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds slept before every answer')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with errors')
+    parser.add_argument('--error-status', type=int, default=500)
+    args = parser.parse_args(argv)
+    server = StubServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, error_status=args.error_status)
+    print('Serving RENAPER/SID stub on {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
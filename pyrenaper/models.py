@@ -1,15 +1,35 @@
 from collections import namedtuple
 from .exceptions import InvalidImageFormatException
-from .settings import STATUS_CODES, SELFIE_TYPE_FORMATS
-import json
+from .settings import STATUS_CODES, SELFIE_TYPE_FORMATS, STEP_SUCCESS_STATUS
+from typing import Dict
+from . import codec
 
 Environment = namedtuple('Environment', ['base_url', 'domain'])
 
+# Response fields RENAPER returns as JSON encoded strings.
+JSON_ENCODED_FIELDS = (('anomalies',),
+                       ('ocr', 'extra', 'additional'),
+                       ('ocr', 'extra', 'mrz'),
+                       ('personData', 'person'),
+                       ('person',))
+
+StepResult = namedtuple('StepResult', ['name', 'response', 'elapsed'])
+
+BatchResult = namedtuple('BatchResult', ['key', 'response', 'error'])
+
+BarcodeResult = namedtuple('BarcodeResult', ['name', 'payload', 'error'])
+
+BatchProgress = namedtuple('BatchProgress', ['submitted', 'completed', 'failed', 'duplicates'])
+
 class Selfie:
+    """
+    Selfie to upload, file can be a base64 encoded image, raw bytes, memoryview,
+    os.PathLike path or binary file object.
+    """
     file = None
     image_type = None
 
-    def __init__(self, file: str, image_type: str):
+    def __init__(self, file, image_type: str):
         if image_type not in SELFIE_TYPE_FORMATS:
             raise InvalidImageFormatException
         self.image_type = image_type
@@ -20,26 +40,28 @@ class Selfie:
 
 
 class RenaperResponse:
-    status = None
-    code = None
-    code_description = None
-    message = None
-    _error_payload = None
-    _response_payload = None
+    """
+    Response of a RENAPER api call.
+    Nested JSON encoded fields (anomalies, ocr.extra.additional, ocr.extra.mrz, personData.person
+    and person) are only decoded when accessed, the original payload is kept untouched in raw.
+    """
+    __slots__ = ('status', 'code', 'code_description', 'message', '_raw', '_response', '_fields')
 
     def __init__(self, data, valid_status):
+        self._raw = data
+        self._response = None
+        self._fields = {}
+        self.message = None
         if data.get('error'):
             self.status = False
-            self.code = data['error'].pop('code')
+            self.code = data['error'].get('code')
             description = STATUS_CODES.get(self.code)
             self.code_description = description if description else 'Unknown'
-            self._error_payload = data['error']
         else:
             self.status = True
-            code = data.pop('code')
+            code = data.get('code')
             self.code = code
-            self.message = data.pop('message')
-            self._response_payload = self._check_for_operation_response(data)
+            self.message = data.get('message')
 
             if STATUS_CODES.get(code):
                 if STATUS_CODES[code] in valid_status:
@@ -49,32 +71,67 @@ class RenaperResponse:
             else:
                 self.code_description = 'Returned Code is not configured in env.'
 
-    def _check_for_operation_response(self, data):
-        if data.get('anomalies'):
-            data['anomalies'] = json.loads(data['anomalies'])
-
-        if data.get('ocr'):
-            if data['ocr'].get('extra'):
-                if data['ocr']['extra'].get('additional'):
-                    data['ocr']['extra']['additional'] = json.loads(data['ocr']['extra']['additional'])
-                if data['ocr']['extra'].get('mrz'):
-                    data['ocr']['extra']['mrz'] = json.loads(data['ocr']['extra']['mrz'])
-
-        if data.get('personData'):
-            if data['personData'].get('person'):
-                data['personData']['person'] = json.loads(data['personData']['person'])
-        if data.get('person'):
-            data['person'] = json.loads(data['person'])
+    @property
+    def raw(self) -> Dict:
+        """Payload exactly as returned by the API."""
+        return self._raw
+
+    def get(self, *path):
+        """
+        Returns the value at path inside the response payload, decoding it if it is a JSON encoded field.
+        Decoded values are memoized.
+            response.get('personData', 'person')
+        """
+        if path in self._fields:
+            return self._fields[path]
+        value = self._raw['error'] if not self.status else self._raw
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        if path in JSON_ENCODED_FIELDS and isinstance(value, (str, bytes)) and value:
+            value = codec.loads(value)
+            self._fields[path] = value
+        return value
+
+    @property
+    def anomalies(self):
+        return self.get('anomalies')
+
+    @property
+    def person(self):
+        return self.get('person')
+
+    @property
+    def person_data(self):
+        return self.get('personData', 'person')
+
+    def _decoded_response(self) -> Dict:
+        data = {key: value for key, value in self._raw.items() if key not in ('code', 'message')}
+        for path in JSON_ENCODED_FIELDS:
+            parent = data
+            for key in path[:-1]:
+                if not isinstance(parent.get(key), dict):
+                    parent = None
+                    break
+                parent[key] = dict(parent[key])
+                parent = parent[key]
+            if parent is not None and parent.get(path[-1]):
+                parent[path[-1]] = self.get(*path)
         return data
+
     @property
     def json(self):
         return {attr: getattr(self, attr) for attr in ['status', 'code', 'code_description', 'message', 'response']}
 
     @property
     def response(self):
-        if not self.status:
-            return self._error_payload
-        return self._response_payload
+        if self._response is None:
+            if not self.status:
+                self._response = {key: value for key, value in self._raw['error'].items() if key != 'code'}
+            else:
+                self._response = self._decoded_response()
+        return self._response
 
     def __str__(self):
         return 'RenaperResponse(status={}, code={}, description={}, response={}'.format(str(self.status),
@@ -84,4 +141,54 @@ class RenaperResponse:
                                                                                         str(self.response))
 
     def __repr__(self):
-        return self.__str__()
\ No newline at end of file
+        return self.__str__()
+
+
+def step_succeeded(name: str, response: RenaperResponse) -> bool:
+    """
+    Whether response is a success for the OnboardingFlow step name, its code must be in
+    STEP_SUCCESS_STATUS for the step. Steps without an entry only need a True status.
+    """
+    if not response.status:
+        return False
+    if name not in STEP_SUCCESS_STATUS:
+        return True
+    return STATUS_CODES.get(response.code) in STEP_SUCCESS_STATUS[name]
+
+
+class OnboardingResult:
+    """
+    Combined result of an OnboardingFlow run.
+    failed_step is the first step whose response is not a success (see step_succeeded).
+    steps keeps one StepResult per executed step in completion order, elapsed times are in seconds.
+    resumed lists the steps restored from an OperationStore instead of being executed.
+    """
+    operation_id = None
+    failed_step = None
+    elapsed = None
+
+    def __init__(self):
+        self.steps = {}
+        self.resumed = []
+
+    def add_step(self, name: str, response: RenaperResponse, elapsed: float) -> None:
+        self.steps[name] = StepResult(name, response, elapsed)
+        if self.failed_step is None and not step_succeeded(name, response):
+            self.failed_step = name
+
+    @property
+    def status(self) -> bool:
+        return self.failed_step is None and 'end_operation' in self.steps
+
+    @property
+    def timings(self):
+        return {name: step.elapsed for name, step in self.steps.items()}
+
+    def __str__(self):
+        return 'OnboardingResult(status={}, operation_id={}, failed_step={}, elapsed={})'.format(str(self.status),
+                                                                                                 str(self.operation_id),
+                                                                                                 str(self.failed_step),
+                                                                                                 str(self.elapsed))
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,72 @@
+from typing import Optional, Dict
+from .cache import LookupCache
+from .models import RenaperResponse
+from .settings import OPERATION_STORE_SETTINGS
+
+
+class OperationStore:
+    """Progress of onboarding operations, keyed by (number, gender, fingerprint).
+
+    OnboardingFlow records the operation id returned by new_operation and every step
+    that succeeded afterwards. When the same person runs the flow again (e.g. the client
+    disconnected half way) the operation is resumed: new_operation and the uploads that
+    already succeeded are skipped and only the missing steps are sent.
+    Any LookupCache backend can be used, SQLiteCacheBackend shares progress between
+    worker processes.
+
+        store = OperationStore(ttl=1800)
+        store = OperationStore(SQLiteCacheBackend('/tmp/pyrenaper-operations.sqlite'))
+        flow = OnboardingFlow(renaper, store=store)
+    """
+    namespace = 'onboarding_operation'
+
+    def __init__(self, backend=None, ttl: Optional[float] = None) -> None:
+        self._cache = LookupCache(backend, ttl if ttl is not None else OPERATION_STORE_SETTINGS['ttl'])
+
+    @staticmethod
+    def _params(number: int, gender: str, fingerprint: str) -> Dict:
+        return {"number": str(number), "gender": gender, "fingerprint": fingerprint}
+
+    def get(self, number: int, gender: str, fingerprint: str) -> Optional[Dict]:
+        """
+        :(dict) return: {"operation_id": int, "steps": {step name: {"raw": payload, "code_description": str}}}
+        or None when there is no operation in progress.
+        """
+        return self._cache.get(self.namespace, self._params(number, gender, fingerprint))
+
+    def start(self, number: int, gender: str, fingerprint: str, operation_id: int,
+              response: RenaperResponse) -> None:
+        """
+        Stores a new operation, replacing any previous one of the same person.
+        """
+        state = {"operation_id": operation_id, "steps": {}}
+        self._set_step(state, 'new_operation', response)
+        self._cache.set(self.namespace, self._params(number, gender, fingerprint), state)
+
+    def add_step(self, number: int, gender: str, fingerprint: str, name: str, response: RenaperResponse) -> None:
+        """
+        Records a successful step of the operation in progress.
+        """
+        params = self._params(number, gender, fingerprint)
+        state = self._cache.get(self.namespace, params)
+        if state is None:
+            return
+        self._set_step(state, name, response)
+        self._cache.set(self.namespace, params, state)
+
+    def delete(self, number: int, gender: str, fingerprint: str) -> None:
+        self._cache.backend.delete(self._cache.key(self.namespace, self._params(number, gender, fingerprint)))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    @staticmethod
+    def _set_step(state: Dict, name: str, response: RenaperResponse) -> None:
+        state["steps"][name] = {"raw": response.raw, "code_description": response.code_description}
+
+    @staticmethod
+    def response(step: Dict) -> RenaperResponse:
+        """
+        Rebuilds the RenaperResponse of a stored step.
+        """
+        return RenaperResponse(step["raw"], [step["code_description"]])
@@ -0,0 +1,187 @@
+"""Parsing of already decoded PDF417 payloads, one at a time or in bulk.
+
+    python -m pyrenaper.pdf417 scans.txt --format csv --output documents.csv --errors rejected.txt
+
+Bulk parsing reads one payload per line from files or iterables and returns the fields column
+wise, payloads that do not match a known layout are collected instead of raising.
+"""
+from operator import itemgetter
+from typing import Optional, Dict, List, Tuple, Iterable, Iterator, Union
+from .exceptions import IncorrectBarcodeException
+from .settings import BARCODE_FIELDS, BARCODE_LAYOUTS, BARCODE_PARSER_SETTINGS
+from . import codec
+import contextlib
+import io
+import itertools
+import os
+import sys
+
+_LAYOUTS = {count: itemgetter(*indexes) for count, indexes in BARCODE_LAYOUTS.items()}
+
+
+def parse_barcode(barcode: str) -> Dict:
+    """
+    Parses Document data from ID PDF417 payload.
+    :(str) barcode: '@' separated payload of the Document ID Barcode.
+    :return: Parsed payload
+    """
+    fields = barcode.split('@')
+    layout = _LAYOUTS.get(len(fields))
+    if layout is None:
+        raise IncorrectBarcodeException
+    return dict(zip(BARCODE_FIELDS, layout(fields)))
+
+
+class BarcodeColumns:
+    """Parsed payloads stored column wise.
+
+    columns maps every BARCODE_FIELDS name to a list of values, the same position of every
+    list belongs to the same payload and payloads keep the input order. bad_rows holds
+    (line_number, payload) for the lines that did not match a layout, line numbers start at 1.
+    """
+
+    def __init__(self, columns: Dict[str, List[str]], bad_rows: List[Tuple[int, str]]) -> None:
+        self.columns = columns
+        self.bad_rows = bad_rows
+
+    def __len__(self) -> int:
+        return len(self.columns[BARCODE_FIELDS[0]])
+
+    def __getitem__(self, field: str) -> List[str]:
+        return self.columns[field]
+
+    def rows(self) -> Iterator[Dict]:
+        """
+        Yields a dict per payload, like parse_barcode.
+        """
+        for values in zip(*self._values()):
+            yield dict(zip(BARCODE_FIELDS, values))
+
+    def _values(self) -> List[List[str]]:
+        return [self.columns[field] for field in BARCODE_FIELDS]
+
+    def write_csv(self, output: io.TextIOBase, header: Optional[bool] = True) -> None:
+        """
+        Writes payloads as CSV rows, columns in BARCODE_FIELDS order.
+        :(file) output: text file opened with newline=''
+        :(bool) header: write the field names first
+        """
+        import csv
+        writer = csv.writer(output)
+        if header:
+            writer.writerow(BARCODE_FIELDS)
+        writer.writerows(zip(*self._values()))
+
+    def write_jsonl(self, output: io.TextIOBase) -> None:
+        """
+        Writes a JSON object per payload and line.
+        :(file) output: text file
+        """
+        dumps = codec.get_codec().dumps
+        output.writelines(dumps(row).decode('utf-8') + '\n' for row in self.rows())
+
+
+@contextlib.contextmanager
+def _lines(source: Union[str, os.PathLike, Iterable[str], io.IOBase], encoding: str) -> Iterator[Iterable[str]]:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding=encoding, errors='replace') as source_file:
+            yield source_file
+    elif hasattr(source, 'read') and not isinstance(source, io.TextIOBase):
+        wrapper = io.TextIOWrapper(source, encoding=encoding, errors='replace')
+        try:
+            yield wrapper
+        finally:
+            # Detached so the wrapper does not close the caller's file once collected.
+            wrapper.detach()
+    else:
+        yield source
+
+
+def _parse(numbered: Iterator[Tuple[int, str]]) -> BarcodeColumns:
+    # Hot loop: a single split and a C level itemgetter per line, rows are kept as tuples
+    # and turned into columns with one zip at the end, no per row dict or exception.
+    rows, bad_rows = [], []
+    add_row, add_bad_row = rows.append, bad_rows.append
+    layouts = _LAYOUTS.get
+    for number, line in numbered:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        fields = line.split('@')
+        layout = layouts(len(fields))
+        if layout is None:
+            add_bad_row((number, line))
+        else:
+            add_row(layout(fields))
+    values = list(map(list, zip(*rows))) if rows else [[] for _ in BARCODE_FIELDS]
+    return BarcodeColumns(dict(zip(BARCODE_FIELDS, values)), bad_rows)
+
+
+def iter_barcode_chunks(source: Union[str, os.PathLike, Iterable[str], io.IOBase],
+                        chunk_size: Optional[int] = None,
+                        encoding: Optional[str] = 'utf-8') -> Iterator[BarcodeColumns]:
+    """
+    Parses payloads, one per line, yielding BarcodeColumns every chunk_size lines so memory
+    use does not depend on the input size. Blank lines are skipped.
+    :(str|file|iterable) source: path of a text file, a text or binary file object, or an iterable of payloads
+    :(int) chunk_size: input lines per chunk, defaults to BARCODE_PARSER_SETTINGS
+    :(str) encoding: used for paths and binary files, undecodable bytes are replaced
+    :(iterator) return: BarcodeColumns objects, bad row line numbers count from the start of source
+    """
+    chunk_size = chunk_size or BARCODE_PARSER_SETTINGS['chunk_size']
+    with _lines(source, encoding) as lines:
+        numbered = enumerate(lines, 1)
+        while True:
+            chunk = list(itertools.islice(numbered, chunk_size))
+            if not chunk:
+                return
+            yield _parse(iter(chunk))
+
+
+def parse_barcodes(source: Union[str, os.PathLike, Iterable[str], io.IOBase],
+                   encoding: Optional[str] = 'utf-8') -> BarcodeColumns:
+    """
+    Parses every payload of source into a single BarcodeColumns, see iter_barcode_chunks.
+    """
+    with _lines(source, encoding) as lines:
+        return _parse(enumerate(lines, 1))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Parse decoded PDF417 payloads, one per line')
+    parser.add_argument('input', help="payloads file, '-' reads stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--output', help='output file, stdout by default')
+    parser.add_argument('--errors', help='write rejected lines to this file as line_number<TAB>payload')
+    parser.add_argument('--chunk-size', type=int, default=BARCODE_PARSER_SETTINGS['chunk_size'])
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else args.input
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    errors = open(args.errors, 'w', encoding='utf-8') if args.errors else None
+    parsed = rejected = 0
+    try:
+        if args.format == 'csv':
+            import csv
+            csv.writer(output).writerow(BARCODE_FIELDS)
+        for chunk in iter_barcode_chunks(source, args.chunk_size):
+            if args.format == 'csv':
+                chunk.write_csv(output, header=False)
+            else:
+                chunk.write_jsonl(output)
+            if errors is not None:
+                errors.writelines('{}\t{}\n'.format(number, line) for number, line in chunk.bad_rows)
+            parsed += len(chunk)
+            rejected += len(chunk.bad_rows)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if errors is not None:
+            errors.close()
+    print('{} parsed, {} rejected'.format(parsed, rejected), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from typing import Optional, Dict
+import time
+
+
+def _import_http() -> None:
+    import requests
+    import requests.adapters
+
+
+def _import_async_http() -> None:
+    import asyncio
+    import httpx
+
+
+def _import_images() -> None:
+    from PIL import Image, ImageOps
+    Image.preinit()
+
+
+def _load_barcode_backend() -> None:
+    from .utils import get_default_backend
+    get_default_backend()
+
+
+def _load_codec() -> None:
+    from . import codec
+    codec.get_codec()
+
+
+def warmup(client=None,
+           http: Optional[bool] = True,
+           images: Optional[bool] = True,
+           barcode: Optional[bool] = False,
+           asynchronous: Optional[bool] = False) -> Dict[str, float]:
+    """
+    Loads heavy dependencies ahead of the first request. pyrenaper imports Pillow, requests,
+    httpx and the barcode backend only when a code path needs them, call warmup at worker
+    start up to pay that cost before serving traffic.
+    :(Renaper|Sid) client: client whose pooled HTTP session is created as well
+    :(bool) http: import requests
+    :(bool) images: import Pillow and its common image plugins
+    :(bool) barcode: load the default barcode backend (zxing-cpp or zxing)
+    :(bool) asynchronous: import asyncio and httpx
+    :(dict) return: seconds spent on each step
+    """
+    steps = [('codec', _load_codec)]
+    if http:
+        steps.append(('http', _import_http))
+    if asynchronous:
+        steps.append(('async_http', _import_async_http))
+    if images:
+        steps.append(('images', _import_images))
+    if barcode:
+        steps.append(('barcode', _load_barcode_backend))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    if client is not None:
+        start = time.perf_counter()
+        transport = client._transport
+        if hasattr(transport, 'session'):
+            transport.session
+        else:
+            transport.client
+        timings['transport'] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,175 @@
+from typing import Optional, Dict, Tuple
+from .exceptions import RateLimitExceededException
+from .settings import RATE_LIMIT_SETTINGS
+import threading
+import time
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _take(tokens: float, requested: float, rate: float) -> Tuple[float, float]:
+    """
+    Returns the remaining tokens and the seconds to wait before requested tokens are available.
+    Tokens are only taken when no wait is needed.
+    """
+    if tokens >= requested:
+        return tokens - requested, 0.0
+    return tokens, (requested - tokens) / rate
+
+
+class MemoryBucketStore:
+    """In-process token bucket store, shared between threads."""
+
+    def __init__(self) -> None:
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            available, updated_at = self._buckets.get(key, (capacity, now))
+            available = _refill(available, updated_at, now, rate, capacity)
+            available, wait = _take(available, tokens, rate)
+            self._buckets[key] = (available, now)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """SQLite file token bucket store, shared between threads and worker processes."""
+
+    def __init__(self, path: str, timeout: Optional[float] = None) -> None:
+        self.path = path
+        self._timeout = timeout if timeout is not None else RATE_LIMIT_SETTINGS['sqlite_timeout']
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+
+    def _connection(self) -> 'sqlite3.Connection':
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent processes
+        # can not read the same bucket state before one of them updates it.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = connection.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?',
+                                     (key,)).fetchone()
+            available, updated_at = row if row is not None else (capacity, now)
+            available = _refill(available, updated_at, now, rate, capacity)
+            available, wait = _take(available, tokens, rate)
+            connection.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) '
+                               'VALUES (?, ?, ?)', (key, available, now))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM rate_limit_buckets')
+
+
+class RateLimiter:
+    """Client side token bucket limiter, one bucket per RENAPER package id.
+
+    limits maps a package id to {"rate": requests per second, "capacity": burst size},
+    capacity defaults to rate. Packages without a limit are never throttled.
+    acquire waits up to timeout seconds for a token (None waits forever, 0 never waits)
+    and raises RateLimitExceededException when it runs out of time.
+
+        limiter = RateLimiter({1: {"rate": 2, "capacity": 5}, 3: {"rate": 10}})
+        limiter = RateLimiter(limits, store=SQLiteBucketStore('/tmp/pyrenaper-limits.sqlite'))
+    """
+
+    def __init__(self,
+                 limits: Dict[int, Dict],
+                 store=None,
+                 timeout: Optional[float] = RATE_LIMIT_SETTINGS['timeout']) -> None:
+        self.limits = {}
+        for p_id, limit in limits.items():
+            rate = float(limit['rate'])
+            if rate <= 0:
+                raise ValueError('Rate for package {} should be positive'.format(p_id))
+            self.limits[p_id] = (rate, float(limit.get('capacity') or rate))
+        self.store = store if store is not None else MemoryBucketStore()
+        self.timeout = timeout
+
+    def _take(self, p_id: int, tokens: float) -> float:
+        rate, capacity = self.limits[p_id]
+        if tokens > capacity:
+            raise ValueError('Can not acquire {} tokens, package {} capacity is {}'.format(tokens, p_id, capacity))
+        return self.store.take('package{}'.format(p_id), rate, capacity, tokens)
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        timeout = self.timeout if timeout is None else timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    @staticmethod
+    def _check_deadline(p_id: int, wait: float, deadline: Optional[float]) -> None:
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise RateLimitExceededException('Rate limit for package {} exceeded.'.format(p_id))
+
+    def try_acquire(self, p_id: int, tokens: float = 1) -> bool:
+        """
+        Takes tokens from the package bucket without waiting.
+        :(int) p_id: package id
+        :(float) tokens: tokens to take
+        :(bool) return: whether the tokens were taken
+        """
+        if p_id not in self.limits:
+            return True
+        return self._take(p_id, tokens) == 0
+
+    def acquire(self, p_id: int, tokens: float = 1, timeout: Optional[float] = None) -> None:
+        """
+        Blocks until tokens are available in the package bucket.
+        :(int) p_id: package id
+        :(float) tokens: tokens to take
+        :(float) timeout: seconds to wait, defaults to the limiter timeout
+        """
+        if p_id not in self.limits:
+            return
+        deadline = self._deadline(timeout)
+        while True:
+            wait = self._take(p_id, tokens)
+            if not wait:
+                return
+            self._check_deadline(p_id, wait, deadline)
+            time.sleep(wait)
+
+    async def aacquire(self, p_id: int, tokens: float = 1, timeout: Optional[float] = None) -> None:
+        """
+        Asyncio version of acquire, waits without blocking the event loop.
+        Shared stores (SQLite) are called from the default executor, their transactions can
+        block while other processes hold the lock.
+        """
+        import asyncio
+        if p_id not in self.limits:
+            return
+        deadline = self._deadline(timeout)
+        loop = asyncio.get_running_loop()
+        in_memory = isinstance(self.store, MemoryBucketStore)
+        while True:
+            if in_memory:
+                wait = self._take(p_id, tokens)
+            else:
+                wait = await loop.run_in_executor(None, self._take, p_id, tokens)
+            if not wait:
+                return
+            self._check_deadline(p_id, wait, deadline)
+            await asyncio.sleep(wait)
@@ -1,43 +1,111 @@
 from collections import defaultdict
-from typing import Optional, Dict, List
-from .decorators import api_call_wrapper, package_id, clean_files
+from typing import Optional, Callable, Dict, List, TYPE_CHECKING
+from .decorators import api_call_wrapper, package_id
 from .exceptions import *
 from .settings import *
-from PIL import Image
-from io import BytesIO
+from .cache import LookupCache
+from . import codec, tracing
+from .body import has_streamed_images, JsonBodyStream
+from .metrics import REQUEST_DURATION, REQUEST_SIZE, RESPONSE_SIZE, HTTP_RESPONSES, API_CODES, \
+    VALIDATION_DURATION, EXCEPTIONS, code_name, image_kind
+from .ratelimit import RateLimiter
+from .singleflight import SingleFlight
+from .retry import RetryPolicy, CircuitBreaker, NO_RETRY, call_with_retry
+from .images import get_image_info, settings_key, as_image_source, RawImage, ImageCache, ImageNormalizer
+from .transport import HttpTransport
+from .pdf417 import parse_barcode
 import base64
-import requests
+import time
 
-Response = requests.models.Response
+if TYPE_CHECKING:
+    from requests import Response
 
 class Renaper:
     """Renaper API implementation.
 
     This class provides methods to access Argentina's Government ID validation Methods.
     Api keys should be obtained in RENAPER's panel: Administration -> API Key.
+    Requests are sent through a pooled keep-alive HttpTransport, pass your own
+    transport to share a connection pool between clients. Use the client as a
+    context manager (or call close) to release pooled connections.
+    Pass a RateLimiter to keep each package within its API key quota, requests wait
+    for a token before any payload is uploaded. Pass a metrics sink (metrics.InMemoryMetrics)
+    to record latencies, payload sizes, status codes and exceptions per endpoint and package.
+    Pass a tracing.Tracer to record a span per call, split into local and network work.
+    Pass a SingleFlight to merge identical idempotent lookups (person_data) that are in
+    flight at the same time into one request.
     """
     _env = None
     _api_keys = defaultdict(None)
     _headers = {"Content-Type": "application/json"}
+    _transport = None
+    _image_cache = None
+    _lookup_cache = None
+    _normalizer = None
+    _retry_policy = None
+    _retry_policies = None
+    _circuit_breaker = None
+    _rate_limiter = None
+    _metrics = None
+    _tracer = None
+    _single_flight = None
 
     def __init__(self,
                  environment: str,
                  package1_apikey: Optional[str] = None,
                  package2_apikey: Optional[str] = None,
-                 package3_apikey: Optional[str] = None) -> None:
+                 package3_apikey: Optional[str] = None,
+                 transport: Optional[HttpTransport] = None,
+                 image_cache: Optional[ImageCache] = None,
+                 lookup_cache: Optional[LookupCache] = None,
+                 normalizer: Optional[ImageNormalizer] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 metrics=None,
+                 tracer: Optional[tracing.Tracer] = None,
+                 single_flight: Optional[SingleFlight] = None) -> None:
         self._env = environment
+        self._tracer = tracer
+        self._single_flight = single_flight
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics
+        self._normalizer = normalizer
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._retry_policies = retry_policies or {}
+        self._circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self._image_cache = image_cache
+        self._lookup_cache = lookup_cache
         self._set_api_keys(package1_apikey, package2_apikey, package3_apikey)
+        self._owns_transport = transport is None
+        self._transport = transport if transport is not None else HttpTransport()
+
+    def close(self) -> None:
+        """
+        Releases pooled connections if the transport is owned by this client.
+        """
+        if self._owns_transport:
+            self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def _set_api_keys(self, *args):
         for i in range(1, len(args)+1):
             self._api_keys[i] = args[i-1]
 
-    def _get_error_code(self, request: Response) -> Dict:
+    def _get_error_code(self, request: 'Response') -> Dict:
         if request.status_code in RENAPER_EXCEPTION_CODES:
             raise RENAPER_EXCEPTION_CODES[request.status_code]
         else:
             if request.status_code == 400:
-                return {"error": request.json()}
+                return {"error": codec.loads(request.content)}
+            if request.status_code >= 500:
+                raise ServerErrorException("{} status code returned".format(str(request.status_code)))
             raise Exception("{} status code returned".format(str(request.status_code)))
 
     def _get_request_headers(self, url: str, p_id: int) -> Dict:
@@ -48,22 +116,109 @@ class Renaper:
         headers['apiKey'] = self._api_keys[p_id]
         return headers
 
+    def _get_cached_lookup(self, url: str, payload: dict) -> Optional[Dict]:
+        if self._lookup_cache is None or url not in CACHEABLE_ENDPOINTS:
+            return None
+        return self._lookup_cache.get(self._build_url(url), payload)
+
+    def _set_cached_lookup(self, url: str, payload: dict, data: Dict) -> None:
+        if self._lookup_cache is None or url not in CACHEABLE_ENDPOINTS:
+            return
+        # Only successful lookups, "not found" and other 200 answers are asked again next time.
+        if STATUS_CODES.get(data.get('code')) != 'RENAPER_OK_EXITO':
+            return
+        self._lookup_cache.set(self._build_url(url), payload, data)
+
+    def _get_retry_policy(self, url: str) -> RetryPolicy:
+        if url in self._retry_policies:
+            return self._retry_policies[url]
+        return self._retry_policy if url in IDEMPOTENT_ENDPOINTS else NO_RETRY
+
+    def _single_flight_key(self, url: str, payload: dict, p_id: int) -> Optional[str]:
+        if self._single_flight is None or url not in IDEMPOTENT_ENDPOINTS:
+            return None
+        return LookupCache.key(self._build_url(url), {"payload": payload, "apiKey": self._api_keys.get(p_id)})
+
     def _make_request(self, url: str, payload: dict, p_id: int) -> Dict:
-        headers = self._get_request_headers(url, p_id)
+        cached = self._get_cached_lookup(url, payload)
+        if cached is not None:
+            return cached
+        key = self._single_flight_key(url, payload, p_id)
+        if key is not None:
+            return self._single_flight.do(key, lambda: self._fetch(url, payload, p_id))
+        return self._fetch(url, payload, p_id)
+
+    def _make_image_request(self, url: str, build_data: Callable[[], Dict], p_id: int) -> Dict:
+        """
+        Sends the payload returned by build_data, which normalizes and validates the request images.
+        AsyncRenaper overrides it to run build_data off the event loop.
+        """
+        return self._make_request(url, self._build_image_request(url, build_data, p_id), p_id)
+
+    def _build_image_request(self, url: str, build_data: Callable[[], Dict], p_id: int) -> Dict:
+        try:
+            return build_data()
+        except Exception as e:
+            self._record_exception(url, p_id, e)
+            raise
+
+    def _fetch(self, url: str, payload: dict, p_id: int) -> Dict:
         try:
-            request = requests.post(self._env.domain,
-                                    json=payload,
-                                    headers=headers)
+            headers = self._get_request_headers(url, p_id)
+            data = call_with_retry(lambda: self._send(url, payload, headers, p_id),
+                                   self._get_retry_policy(url),
+                                   self._circuit_breaker)
         except Exception as e:
-            raise e
+            self._record_exception(url, p_id, e)
+            raise
+        self._set_cached_lookup(url, payload, data)
+        return data
+
+    def _send(self, url: str, payload: dict, headers: dict, p_id: int) -> Dict:
+        if self._rate_limiter is not None:
+            with tracing.span('rate_limit', tracing.WAIT):
+                self._rate_limiter.acquire(p_id)
+        with tracing.span('encode', tracing.LOCAL):
+            streamed = has_streamed_images(payload)
+            body = JsonBodyStream(payload) if streamed else codec.dumps(payload)
+        with tracing.span('request', tracing.NETWORK, endpoint=url, streamed=streamed) as span:
+            start = time.perf_counter()
+            request = self._transport.post(self._env.domain, data=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            span.set_attribute('http.status_code', request.status_code)
+        with tracing.span('decode', tracing.LOCAL):
+            return self._handle_response(url, p_id, request, elapsed, len(body))
+
+    def _handle_response(self, url: str, p_id: int, request: 'Response', elapsed: float, request_size: int) -> Dict:
+        """
+        Records request metrics and decodes the response payload.
+        :(str) url: method url
+        :(int) p_id: package id
+        :(Response) request: HTTP response
+        :(float) elapsed: seconds spent on the request
+        :(int) request_size: request body length
+        :(dict) return: decoded payload, error payloads are wrapped in {"error": payload}
+        """
+        if self._metrics is not None:
+            labels = {"endpoint": url, "package": p_id}
+            self._metrics.observe(REQUEST_DURATION, labels, elapsed)
+            self._metrics.observe(REQUEST_SIZE, labels, request_size)
+            self._metrics.observe(RESPONSE_SIZE, labels, len(request.content))
+            self._metrics.increment(HTTP_RESPONSES, dict(labels, status=request.status_code))
+        if request.status_code != 200:
+            data = self._get_error_code(request)
         else:
-            if request.status_code != 200:
-                try:
-                    error_payload = self._get_error_code(request)
-                    return error_payload
-                except Exception as e:
-                    raise e
-        return request.json()
+            data = codec.loads(request.content)
+        if self._metrics is not None:
+            code = code_name(data)
+            if code is not None:
+                self._metrics.increment(API_CODES, {"endpoint": url, "package": p_id, "code": code})
+        return data
+
+    def _record_exception(self, url: str, p_id: int, exception: Exception) -> None:
+        if self._metrics is not None:
+            self._metrics.increment(EXCEPTIONS, {"endpoint": url, "package": p_id,
+                                                 "exception": type(exception).__name__})
 
     def _build_url(self, uri: str) -> str:
         """
@@ -76,66 +231,102 @@ class Renaper:
     def _validate_image(self, image: str, settings: Dict):
         """
         Checks validity of image to uplaod.
-        :(image) image: Pillow Image object to validate
+        JPEG sizes are read from the image header, Pillow is only used for other formats.
+        :(base64 image) image: base64 encoded image to validate
         :(dict) settings: Image format settings.
         """
         try:
-            image = Image.open(BytesIO(base64.b64decode(image)))
+            image_format, width, height = get_image_info(image)
         except Exception as e:
             raise InvalidImage('Not able to parse provided image')
         else:
-            if image.format.lower() not in settings['formats']:
-                raise InvalidImageFormatException(image.format.lower(), settings['formats'])
-            if not (settings['min_length'] <= image.width <= settings['max_length']):
-                raise InvalidLengthException(image.width, settings['min_length'], settings['max_length'])
+            if image_format not in settings['formats']:
+                raise InvalidImageFormatException(image_format, settings['formats'])
+            if not (settings['min_length'] <= width <= settings['max_length']):
+                raise InvalidLengthException(width, settings['min_length'], settings['max_length'])
             if 'height' in settings.keys():
-                if not (settings['min_height'] <= image.height <= settings['max_height']):
-                    raise InvalidHeightException(image.width, settings['min_height'], settings['max_height'])
+                if not (settings['min_height'] <= height <= settings['max_height']):
+                    raise InvalidHeightException(width, settings['min_height'], settings['max_height'])
+
+    def _timed_validate_image(self, image: str, settings: Dict, url: Optional[str] = None,
+                              p_id: Optional[int] = None):
+        if self._metrics is None:
+            return self._validate_image(image, settings)
+        start = time.perf_counter()
+        valid = False
+        try:
+            self._validate_image(image, settings)
+            valid = True
+        finally:
+            self._metrics.observe(VALIDATION_DURATION, {"endpoint": url, "package": p_id,
+                                                        "image": image_kind(settings), "valid": valid},
+                                  time.perf_counter() - start)
 
     def _decode_image(self, image):
+        if isinstance(image, RawImage):
+            return image
         return image.decode() if type(image) == bytes else image
 
+    def _normalize_images(self, images: List, settings: Dict) -> List:
+        """
+        Runs images through the configured normalizer, results are reused from the image cache.
+        :(list) images: base64 encoded images
+        :(dict) settings: Image format settings.
+        :(list) return: normalized images, unchanged if no normalizer is configured.
+        """
+        images = [as_image_source(image) for image in images]
+        if self._normalizer is None:
+            return images
+        with tracing.span('normalize', tracing.LOCAL, images=len(images)):
+            return self._normalize_cached_images(images, settings)
+
+    def _normalize_cached_images(self, images: List, settings: Dict) -> List:
+        if self._image_cache is None:
+            return self._normalizer.normalize_many(images, settings)
+
+        keys = [(self._image_cache.digest(image), 'normalized', settings_key(settings), self._normalizer.cache_key)
+                for image in images]
+        normalized = [self._image_cache.get(key) for key in keys]
+        missing = [i for i in range(len(images)) if normalized[i] is None]
+        if missing:
+            results = self._normalizer.normalize_many([images[i] for i in missing], settings)
+            for i, result in zip(missing, results):
+                self._image_cache.set(keys[i], result)
+                normalized[i] = result
+        return normalized
+
+    def _prepare_image(self, image: str, settings: Dict, url: Optional[str] = None, p_id: Optional[int] = None) -> str:
+        """
+        Validates image and returns its payload ready for api usage.
+        :(image) image: base64 encoded image, raw bytes, memoryview, os.PathLike path or binary file object
+        :(dict) settings: Image format settings.
+        :(str) url: method url the image is uploaded to, used as metrics label.
+        :(int) p_id: package id, used as metrics label.
+        :(str|RawImage) return: base64 string payload, raw images are kept as RawImage to be streamed
+        """
+        with tracing.span('validate', tracing.LOCAL):
+            image = as_image_source(image)
+            # Only the header is parsed, hashing the payload to cache the outcome would cost more.
+            self._timed_validate_image(image, settings, url, p_id)
+            return self._decode_image(image)
+
     def _parse_barcode(self, barcode: str) -> Dict:
         """
         Parses Document data from ID PDF417 QR code.
-        :(base64 img) barcode: Front/Back or simple image of Document ID Barcode.
+        :(str) barcode: decoded payload of the Document ID Barcode.
         :return: Parsed payload
         """
-        barcode_data = barcode.split('@')
-        if 8 <= len(barcode_data) <= 9:
-            data = {"order": barcode_data[0],
-                    "lastNames": barcode_data[1],
-                    "names": barcode_data[2],
-                    "gender": barcode_data[3],
-                    "number": barcode_data[4],
-                    "birthdate": barcode_data[6]}
-        elif 16 <= len(barcode_data) <= 17:
-            data = {"order": barcode_data[0],
-                    "lastNames": barcode_data[4],
-                    "names": barcode_data[5],
-                    "gender": barcode_data[8],
-                    "number": barcode_data[1],
-                    "birthdate": barcode_data[7]}
-        else:
-            raise IncorrectBarcodeException
-        return data
+        return parse_barcode(barcode)
 
-    @clean_files
     def _get_barcode_payload(self, operation_id: int, image: str) -> Dict:
         """
-        DEPRECATED
+        DEPRECATED, use utils.BarcodeReader.
         Extracts information from Argentina's PDF417 Qr Code.
         :(base64 img) image: Image containing Argentina's Government PDF417 QR Code.
         :return:
         """
-        filename = '{}.jpg'.format(str(operation_id))
-        np_img = Image.open(BytesIO(base64.b64decode(image)))
-        np_img.save(filename)
-        reader = zxing.BarCodeReader()
-        barcode = reader.decode(filename)
-        if not barcode:
-            raise BarcodeNotFoundException
-        return self._parse_barcode(barcode.parsed)
+        from .utils import BarcodeReader
+        return BarcodeReader().get_barcode_payload(image)
 
     def _add_document_image(self,
                             operation_type: str,
@@ -152,37 +343,42 @@ class Renaper:
         :(int) operation_id: operation_id retrieved from new_operation_method
         :(int) number: government ID number
         :(str) gender: gender must be M / F
-        :(base64 image) file: image file base64 encoded, sizes must match settings for document image.
+        :(image) file: base64 encoded image, raw bytes, os.PathLike path or binary file object,
+                       sizes must match settings for document image.
         :(boolean) analyze_anomalies: Check veracity by area. Result will be provided by end_operation
         :(boolean) analyze_ocr: Checks document with OCR capabilities. Result will be provided by end_operation
         :(dict) return:
         """
-        if operation_type not in ['front', 'back']:
-            raise InvalidOperation("Operations are either front or back.")
-
-        self._validate_image(file, DOCUMENT_FORMAT_SETTINGS)
+        url, p_id = "onboarding/add{}".format(operation_type.title()), kwargs.get('package_id')
 
-        data = {"operationId": operation_id,
-                "number": number,
-                "gender": gender,
-                "analyzeAnomalies": analyze_anomalies,
-                "analyzeOcr": analyze_ocr,
-                "file": self._decode_image(file)}
-        return self._make_request("onboarding/add{}".format(operation_type.title()), data, kwargs.get('package_id'))
+        def build_data():
+            if operation_type not in ['front', 'back']:
+                raise InvalidOperation("Operations are either front or back.")
+            image = self._normalize_images([file], DOCUMENT_FORMAT_SETTINGS)[0]
+            return {"operationId": operation_id,
+                    "number": number,
+                    "gender": gender,
+                    "analyzeAnomalies": analyze_anomalies,
+                    "analyzeOcr": analyze_ocr,
+                    "file": self._prepare_image(image, DOCUMENT_FORMAT_SETTINGS, url, p_id)}
+        return self._make_image_request(url, build_data, p_id)
 
-    def _check_selfie_format(self, selfie_list: List) -> Dict:
+    def _check_selfie_format(self, selfie_list: List, url: Optional[str] = None, p_id: Optional[int] = None) -> Dict:
         """
         Validates selfies with settings provided in SELFIE_FORMAT_SETTINGS
         :(list) selfie_list: List of selfie_dictionaries with format: {"file": file, "type": type}
+        :(str) url: method url the selfies are uploaded to, used as metrics label.
+        :(int) p_id: package id, used as metrics label.
         :(list) returns: List of selfies parsed for api usage.
         """
         selfies = []
         if not len(selfie_list):
             raise EmptySelfieListException
 
+        files = self._normalize_images([selfie.file for selfie in selfie_list], SELFIE_FORMAT_SETTINGS)
         for i in range(len(selfie_list)):
-            self._validate_image(selfie_list[i].file, SELFIE_FORMAT_SETTINGS)
-            selfies.append(dict(file=self._decode_image(selfie_list[i].file), imageType=selfie_list[i].image_type))
+            selfies.append(dict(file=self._prepare_image(files[i], SELFIE_FORMAT_SETTINGS, url, p_id),
+                                imageType=selfie_list[i].image_type))
 
         return selfies
 
@@ -247,12 +443,14 @@ class Renaper:
         :(list) selfie_list: List of selfie_dictionaries with format: {"file": file, "type": type}
         :(str) return:
         """
-        selfie_list = self._check_selfie_format(selfie_list)
-        data = {"operationId": operation_id,
-                "number": number,
-                "gender": gender,
-                "selfieList": selfie_list}
-        return self._make_request('onboarding/register', data, kwargs.get('package_id'))
+        url, p_id = 'onboarding/register', kwargs.get('package_id')
+
+        def build_data():
+            return {"operationId": operation_id,
+                    "number": number,
+                    "gender": gender,
+                    "selfieList": self._check_selfie_format(selfie_list, url, p_id)}
+        return self._make_image_request(url, build_data, p_id)
 
     @package_id(2)
     @api_call_wrapper(['FACE_COMPARE_OK'])
@@ -270,12 +468,14 @@ class Renaper:
         :(str) browser_fingerprint: Fingerprint provided by Renaper's JS library.
         :(str) return:
         """
-        selfie_list = self._check_selfie_format(selfie_list)
-        data = {"number": number,
-                "gender": gender,
-                "selfieList": selfie_list,
-                "browserFingerprintData": browser_fingerprint}
-        return self._make_request('face/login', data, kwargs.get('package_id'))
+        url, p_id = 'face/login', kwargs.get('package_id')
+
+        def build_data():
+            return {"number": number,
+                    "gender": gender,
+                    "selfieList": self._check_selfie_format(selfie_list, url, p_id),
+                    "browserFingerprintData": browser_fingerprint}
+        return self._make_image_request(url, build_data, p_id)
 
     @package_id(1)
     @api_call_wrapper(['END_OPERATION_OK', 'SCORE_SUCCESS', 'ANALYZE_DOCUMENT_OK'])
@@ -300,12 +500,16 @@ class Renaper:
     @api_call_wrapper(['BARCODE_SCAN_OK'])
     def scan_barcode(self, image_file: str, **kwargs) -> Dict:
         """
-        :(base64 imaeg)  image_file: 417 Barcode image.
+        :(image)  image_file: 417 Barcode image, base64 encoded, raw bytes, os.PathLike path or binary file object.
         :(boolean) local: Attempts to decode the barcode locally.
         :return:
         """
-        self._validate_image(image_file, DOCUMENT_FORMAT_SETTINGS)
-        return self._make_request('onboarding/scanBarcode', {"file": image_file}, kwargs.get('package_id'))
+        url, p_id = 'onboarding/scanBarcode', kwargs.get('package_id')
+
+        def build_data():
+            image = self._normalize_images([image_file], DOCUMENT_FORMAT_SETTINGS)[0]
+            return {"file": self._prepare_image(image, DOCUMENT_FORMAT_SETTINGS, url, p_id)}
+        return self._make_image_request(url, build_data, p_id)
 
     @package_id(1)
     @api_call_wrapper(['ADD_BARCODE_OK'])
@@ -0,0 +1,182 @@
+from typing import Optional, Callable
+from .exceptions import ServerErrorException, CircuitOpenException
+from .settings import RETRY_SETTINGS, CIRCUIT_BREAKER_SETTINGS
+import random
+import sys
+import threading
+import time
+
+
+def _transient_errors() -> tuple:
+    errors = [ServerErrorException, ConnectionError, TimeoutError]
+    # Only HTTP clients that were already imported are checked, they are loaded lazily.
+    requests = sys.modules.get('requests')
+    if requests is not None:
+        errors += [requests.ConnectionError, requests.Timeout]
+    httpx = sys.modules.get('httpx')
+    if httpx is not None:
+        errors += [httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError]
+    return tuple(errors)
+
+
+def is_transient(exception: Exception) -> bool:
+    """
+    Connection errors, timeouts and 5xx responses are considered transient. Other OSErrors
+    (missing or unreadable image files, ...) are not retried.
+    """
+    return isinstance(exception, _transient_errors())
+
+
+class RetryPolicy:
+    """Retries transient failures with exponential backoff and full jitter.
+
+    The delay before attempt n (starting at 1) is a random value between 0 and
+    min(max_backoff, backoff * 2 ** (n - 1)).
+    """
+
+    def __init__(self,
+                 max_attempts: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None,
+                 jitter: Optional[bool] = True,
+                 retry_on: Optional[Callable[[Exception], bool]] = None) -> None:
+        self.max_attempts = max_attempts if max_attempts is not None else RETRY_SETTINGS['max_attempts']
+        self.backoff = backoff if backoff is not None else RETRY_SETTINGS['backoff']
+        self.max_backoff = max_backoff if max_backoff is not None else RETRY_SETTINGS['max_backoff']
+        self.jitter = jitter
+        self.retry_on = retry_on or is_transient
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def should_retry(self, exception: Exception, attempt: int) -> bool:
+        return attempt < self.max_attempts and not isinstance(exception, CircuitOpenException) \
+            and self.retry_on(exception)
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """Fails fast while the remote service is down.
+
+    After failure_threshold consecutive transient failures the circuit opens and every call
+    raises CircuitOpenException for reset_timeout seconds. Then a single trial call is let
+    through (half open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self,
+                 failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None) -> None:
+        self.failure_threshold = failure_threshold if failure_threshold is not None \
+            else CIRCUIT_BREAKER_SETTINGS['failure_threshold']
+        self.reset_timeout = reset_timeout if reset_timeout is not None \
+            else CIRCUIT_BREAKER_SETTINGS['reset_timeout']
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenException
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """
+        Ends the trial call without counting it, the next call is let through as a new trial.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record(self, exception: Optional[Exception]) -> None:
+        if exception is None:
+            self.record_success()
+        elif is_transient(exception):
+            self.record_failure()
+        else:
+            self.release_trial()
+
+
+def call_with_retry(func: Callable, policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None):
+    """
+    Calls func until it succeeds, a non retryable exception is raised or policy runs out of attempts.
+    """
+    attempt = 1
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(e)
+            if not policy.should_retry(e, attempt):
+                raise
+        except BaseException:
+            # Cancelled (or interrupted) calls say nothing about the service health.
+            if breaker is not None:
+                breaker.release_trial()
+            raise
+        else:
+            if breaker is not None:
+                breaker.record(None)
+            return result
+        time.sleep(policy.delay(attempt))
+        attempt += 1
+
+
+async def acall_with_retry(func: Callable, policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None):
+    """
+    Asyncio version of call_with_retry, func must return an awaitable.
+    """
+    attempt = 1
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await func()
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(e)
+            if not policy.should_retry(e, attempt):
+                raise
+        except BaseException:
+            # Cancelled (or interrupted) calls say nothing about the service health.
+            if breaker is not None:
+                breaker.release_trial()
+            raise
+        else:
+            if breaker is not None:
+                breaker.record(None)
+            return result
+        import asyncio
+        await asyncio.sleep(policy.delay(attempt))
+        attempt += 1
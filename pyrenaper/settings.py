@@ -22,6 +22,81 @@ SELFIE_TYPE_FORMATS = ['SN', 'SS', 'SCE', 'SBL', 'SBR']
 
 APPLICATION_VERSION = "1.0.0"
 
+HTTP_POOL_SETTINGS = {"pool_connections": 10,
+                      "pool_maxsize": 10,
+                      "pool_block": False,
+                      "keep_alive": True,
+                      "connect_timeout": 5,
+                      "read_timeout": 30}
+
+IMAGE_CACHE_SETTINGS = {"maxsize": 64}
+
+IMAGE_NORMALIZATION_SETTINGS = {"quality": 90,
+                                "workers": 4}
+
+LOOKUP_CACHE_SETTINGS = {"ttl": 3600,
+                         "max_entries": 10000}
+
+JSON_BACKENDS = ['orjson', 'ujson', 'json']
+
+BARCODE_BACKENDS = ['zxingcpp', 'zxing']
+
+BARCODE_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff']
+
+BARCODE_FIELDS = ['order', 'lastNames', 'names', 'gender', 'number', 'birthdate']
+
+# Position of each BARCODE_FIELDS value, by amount of '@' separated fields of the payload.
+BARCODE_LAYOUTS = {8: (0, 1, 2, 3, 4, 6),
+                   9: (0, 1, 2, 3, 4, 6),
+                   16: (0, 4, 5, 8, 1, 7),
+                   17: (0, 4, 5, 8, 1, 7)}
+
+BARCODE_PARSER_SETTINGS = {"chunk_size": 100000}
+
+BATCH_SETTINGS = {"concurrency": 8}
+
+OPERATION_STORE_SETTINGS = {"ttl": 3600}
+
+# Codes accepted as success for each OnboardingFlow step, other answers (even HTTP 200 ones) fail the step.
+STEP_SUCCESS_STATUS = {"new_operation": ['NEW_OPERATION_OK'],
+                       "add_front": ['ADD_FRONT_OK', 'ANALYZE_DOCUMENT_OK'],
+                       "add_back": ['ADD_BACK_OK', 'ANALYZE_DOCUMENT_OK'],
+                       "register": ['ADD_SELFIES_OK'],
+                       "add_barcode": ['ADD_BARCODE_OK'],
+                       "end_operation": ['END_OPERATION_OK', 'SCORE_SUCCESS', 'ANALYZE_DOCUMENT_OK']}
+
+# Step failures meaning the stored operation can not be resumed anymore.
+EXPIRED_OPERATION_STATUS = ['OPERATION_NOT_EXIST',
+                            'OPERATION_DOESNT_BELONG',
+                            'OPERATION_DISABLED']
+
+SID_TOKEN_SETTINGS = {"ttl": 3600,
+                      "refresh_margin": 60}
+
+RETRY_SETTINGS = {"max_attempts": 3,
+                  "backoff": 0.5,
+                  "max_backoff": 8}
+
+CIRCUIT_BREAKER_SETTINGS = {"failure_threshold": 5,
+                            "reset_timeout": 30}
+
+RATE_LIMIT_SETTINGS = {"timeout": 30,
+                       "sqlite_timeout": 5}
+
+METRICS_SETTINGS = {"latency_buckets": [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+                    "size_buckets": [1024, 10240, 102400, 512000, 1048576, 5242880, 10485760]}
+
+TRACING_SETTINGS = {"max_spans": 10000}
+
+IDEMPOTENT_ENDPOINTS = ['status',
+                        'information/personData',
+                        'apidatos/porDniSexo.php',
+                        'apidatos/porDniSexoTramite.php']
+
+CACHEABLE_ENDPOINTS = ['information/personData',
+                       'apidatos/porDniSexo.php',
+                       'apidatos/porDniSexoTramite.php']
+
 STATUS_CODES = {901: 'NEW_OPERATION_OK',
                 903: 'END_OPERATION_OK',
                 904: 'END_OPERATION_FAIL',
@@ -2,23 +2,66 @@ from collections import defaultdict
 from typing import Optional, Dict, List
 from .exceptions import *
 from .settings import *
-from PIL import Image
-from io import BytesIO
-import requests
+from . import codec
+from .cache import LookupCache
+from .retry import RetryPolicy, CircuitBreaker, NO_RETRY, call_with_retry
+from .singleflight import SingleFlight
+from .transport import HttpTransport
+import base64
+import json
+import threading
+import time
 
 class Sid:
     """Renaper SID API implementation.
 
     This class provides methods to access Argentina's Government ID validation Methods.
     User and password credentials should be obtained in RENAPER's panel: Administration -> API Key.
+    Requests are sent through a pooled keep-alive HttpTransport.
+    Pass a LookupCache to serve repeated person data lookups without hitting the API.
+    The auth token is fetched lazily, shared between threads and refreshed before it
+    expires or once after the API rejects it, calling login is optional.
+    Transient failures of person data lookups are retried following retry_policy and every
+    request goes through a circuit breaker.
+    Pass a SingleFlight to merge identical lookups that are in flight at the same time
+    into one request.
     """
-    _token = None
+    # (token, expiration timestamp), replaced as a whole so readers never mix two tokens.
+    _token_state = (None, 0.0)
     _env = None
+    _transport = None
+    _lookup_cache = None
+    _retry_policy = None
+    _circuit_breaker = None
+    _single_flight = None
     
-    def __init__(self, env: str, username: str, password: str) -> None: 
+    def __init__(self, env: str, username: str, password: str,
+                 transport: Optional[HttpTransport] = None,
+                 lookup_cache: Optional[LookupCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 single_flight: Optional[SingleFlight] = None) -> None: 
         self._env = env
+        self._lookup_cache = lookup_cache
+        self._single_flight = single_flight
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
         self._credentials = {"username": username, 
                             "password": password}
+        self._owns_transport = transport is None
+        self._transport = transport if transport is not None else HttpTransport()
+        self._token_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Releases pooled connections if the transport is owned by this client."""
+        if self._owns_transport:
+            self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
         
     def build_url(self, url: str) -> str:
         """Contactenates domain url with current api request uris
@@ -31,43 +74,124 @@ class Sid:
         """
         return ''.join((self._env.base_url, url))
     
-    def _get_auth_headers(self):
-        return {"Authorization": " ".join(("Bearer", self._token))}        
+    def _get_auth_headers(self, token: Optional[str] = None):
+        if token is None:
+            token = self._get_valid_token()
+        return {"Authorization": " ".join(("Bearer", token))}
+
+    def _token_expiration(self, token: str) -> float:
+        """
+        Reads the exp claim of JWT tokens, falls back to SID_TOKEN_SETTINGS ttl.
+        """
+        try:
+            claims = token.split('.')[1]
+            claims = json.loads(base64.urlsafe_b64decode(claims + '=' * (-len(claims) % 4)))
+            return float(claims['exp'])
+        except Exception:
+            return time.time() + SID_TOKEN_SETTINGS['ttl']
+
+    @property
+    def _token(self) -> Optional[str]:
+        return self._token_state[0]
+
+    def _valid_token(self) -> Optional[str]:
+        """
+        Returns the current token unless it is missing or about to expire.
+        """
+        token, expires_at = self._token_state
+        if token is not None and time.time() < expires_at - SID_TOKEN_SETTINGS['refresh_margin']:
+            return token
+        return None
+
+    def _token_is_valid(self) -> bool:
+        return self._valid_token() is not None
+
+    def _set_token(self, token: str) -> None:
+        self._token_state = (token, self._token_expiration(token))
+
+    def _get_valid_token(self) -> str:
+        """
+        Returns the current token, fetching a new one when missing or about to expire.
+        Only one thread performs the refresh, the rest wait for it and reuse its token.
+        """
+        token = self._valid_token()
+        if token is not None:
+            return token
+        with self._token_lock:
+            token = self._valid_token()
+            if token is None:
+                token = self.get_token(self._credentials)
+                self._set_token(token)
+            return token
+
+    def _invalidate_token(self, token: str) -> None:
+        with self._token_lock:
+            if self._token == token:
+                self._token_state = (None, 0.0)
+
+    def _authorized_request(self, url: str, params: dict) -> Dict:
+        """
+        Performs a GET request with the shared token, retrying once with a fresh token if it is rejected.
+        """
+        token = self._get_valid_token()
+        try:
+            return self._make_request(url, params, http_method='GET',
+                                      headers=self._get_auth_headers(token))
+        except SidAuthenticationException:
+            self._invalidate_token(token)
+            return self._make_request(url, params, http_method='GET',
+                                      headers=self._get_auth_headers())
 
-            
-    def _make_request(self, url: str, payload: dict=None, 
+
+    def _parse_response(self, request) -> Dict:
+        if request.status_code in (401, 403):
+            raise SidAuthenticationException
+        if request.status_code >= 500:
+            raise ServerErrorException("{} status code returned".format(str(request.status_code)))
+        if request.status_code != 200:
+            try:
+                return request.body
+            except Exception as e:
+                raise e
+
+        data = codec.loads(request.content)
+
+        if 'data' in data:
+            data = data['data']
+
+        if data['codigo'] not in  [0, 99]:
+            raise Exception(data.get('mensaje'))
+
+        return data
+
+    def _get_retry_policy(self, url: str) -> RetryPolicy:
+        return self._retry_policy if url in IDEMPOTENT_ENDPOINTS else NO_RETRY
+
+    def _make_request(self, url: str, payload: dict=None,
                       headers: dict=None, http_method: str='GET') -> Dict:
+        return call_with_retry(lambda: self._send(url, payload, headers, http_method),
+                               self._get_retry_policy(url),
+                               self._circuit_breaker)
+
+    def _send(self, url: str, payload: dict=None, 
+              headers: dict=None, http_method: str='GET') -> Dict:
         
         try:
             if http_method == 'POST':
-                request = requests.post(self.build_url(url),
-                                        data=payload,
-                                        headers=headers)
+                request = self._transport.post(self.build_url(url),
+                                               data=payload,
+                                               headers=headers)
             else:
-                request = requests.get(self.build_url(url),
-                                       params = payload,
-                                       headers=headers) 
+                request = self._transport.get(self.build_url(url),
+                                              params = payload,
+                                              headers=headers) 
         except Exception as e:
             raise e
-        else:
-            if request.status_code != 200:
-                try:
-                    return request.body
-                except Exception as e:
-                    raise e
-                
-            data = request.json()
-            
-            if 'data' in data:
-                data = data['data']
-        
-            if data['codigo'] not in  [0, 99]:
-                raise Exception(data.get('mensaje'))
-        
-        return data
+        return self._parse_response(request)
 
     def login(self):
-        self._token = self.get_token(self._credentials)
+        with self._token_lock:
+            self._set_token(self.get_token(self._credentials))
         
     def get_token(self, credentials) -> str:
         token_data = self._make_request("CHUTROFINAL/API_ABIS/Autorizacion/token.php",
@@ -75,18 +199,41 @@ class Sid:
         return token_data['token']
         
         
+    def _get_cached_lookup(self, url: str, params: dict) -> Optional[Dict]:
+        if self._lookup_cache is None or url not in CACHEABLE_ENDPOINTS:
+            return None
+        return self._lookup_cache.get(self.build_url(url), params)
+
+    def _set_cached_lookup(self, url: str, params: dict, data: Dict) -> None:
+        if self._lookup_cache is None or url not in CACHEABLE_ENDPOINTS or data.get('codigo') != 0:
+            return
+        self._lookup_cache.set(self.build_url(url), params, data)
+
+    def _single_flight_key(self, url: str, params: dict) -> Optional[str]:
+        if self._single_flight is None:
+            return None
+        return LookupCache.key(self.build_url(url), {"params": params, "username": self._credentials['username']})
+
+    def _lookup(self, url: str, params: dict) -> Dict:
+        cached = self._get_cached_lookup(url, params)
+        if cached is not None:
+            return cached
+        key = self._single_flight_key(url, params)
+        if key is not None:
+            return self._single_flight.do(key, lambda: self._fetch(url, params))
+        return self._fetch(url, params)
+
+    def _fetch(self, url: str, params: dict) -> Dict:
+        person_data = self._authorized_request(url, params)
+        self._set_cached_lookup(url, params, person_data)
+        return person_data
+
     def get_basic_person_data(self, person_id: str, gender: str) -> Dict:
         params = {"dni": person_id, "sexo": gender}
-        person_data = self._make_request("apidatos/porDniSexo.php",
-                                params, http_method='GET',
-                                headers=self._get_auth_headers())
-        return person_data
+        return self._lookup("apidatos/porDniSexo.php", params)
     
     def get_full_person_data(self, person_id: str, gender: str, operation_id: str) -> Dict:
         params = {"dni": person_id, "sexo": gender, "idtramite": operation_id}
-        person_data = self._make_request("apidatos/porDniSexoTramite.php",
-                                params, http_method='GET',
-                                headers=self._get_auth_headers())
-        return person_data
+        return self._lookup("apidatos/porDniSexoTramite.php", params)
     
     
\ No newline at end of file
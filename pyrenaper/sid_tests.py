@@ -1,6 +1,19 @@
 from pyrenaper.sid import Sid
-from pyrenaper.utils import BarcodeReader
+from pyrenaper.async_sid import AsyncSid
+from pyrenaper.utils import BarcodeReader, decode_barcodes
+from pyrenaper.exceptions import IncorrectBarcodeException, BarcodeNotFoundException
+from pyrenaper.environments import SID
+from pyrenaper.retry import RetryPolicy
+from pyrenaper.singleflight import SingleFlight
+from pyrenaper.pdf417 import parse_barcodes, iter_barcode_chunks
+from pyrenaper.mocks.server import StubServer
+from pyrenaper.mocks.response import MockResponse, MockTransport, AsyncMockTransport
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import base64
+import gc
+import io
+import os
 import unittest
 
 PAQUETE1_API_KEY = ''
@@ -14,6 +27,14 @@ USERNAME = ''
 PASSWORD = ''
 environment = {"base_url": "https://apirenaper.idear.gov.ar/"}
 
+class MockBarcodeBackend:
+    def __init__(self, text):
+        self.text = text
+
+    def decode(self, image):
+        return self.text
+
+
 class SidTest(unittest.TestCase):
 
     def setUp(self):
@@ -44,4 +65,133 @@ class SidTest(unittest.TestCase):
         reader = BarcodeReader()
         with open("mocks/front.jpg", "rb") as image_file:
             encoded_barcode = base64.b64encode(image_file.read())
-            data = reader.get_barcode_payload(encoded_barcode)
\ No newline at end of file
+            data = reader.get_barcode_payload(encoded_barcode)
+
+    def test_barcode_not_an_id(self):
+        reader = BarcodeReader()
+        with open("mocks/qr.png", "rb") as image_file:
+            with self.assertRaises(IncorrectBarcodeException) as context:
+                reader.get_barcode_payload_from_bytes(image_file.read())
+
+    def test_decode_barcodes(self):
+        results = {os.path.basename(result.name): result for result in decode_barcodes("mocks", workers=2)}
+        self.assertEqual(set(results), {"front.jpg", "back.jpg", "selfie.jpg", "qr.png"})
+        self.assertIsInstance(results["qr.png"].error, IncorrectBarcodeException)
+        self.assertIsInstance(results["selfie.jpg"].error, BarcodeNotFoundException)
+
+    def test_decode_barcodes_single_path(self):
+        results = list(decode_barcodes("mocks/qr.png", workers=1))
+        self.assertEqual([result.name for result in results], ["mocks/qr.png"])
+        self.assertIsInstance(results[0].error, IncorrectBarcodeException)
+        with self.assertRaises(FileNotFoundError):
+            list(decode_barcodes("missing/front.jpg", workers=1))
+
+    def test_barcode_custom_backend(self):
+        reader = BarcodeReader(backend=MockBarcodeBackend('00123456789@DOE@JOHN@M@12345678@A@01/01/1990@01/01/2015'))
+        with open("mocks/front.jpg", "rb") as image_file:
+            data = reader.get_barcode_payload_from_bytes(image_file.read())
+        self.assertEqual(data['number'], '12345678')
+        self.assertEqual(data['birthdate'], '01/01/1990')
+
+
+class BulkBarcodeTest(unittest.TestCase):
+    SHORT = '00123456789@PEREZ@JUAN CARLOS@M@12345678@A@01/02/1980@15/06/2015@200'
+    LONG = '@22333444    @A@1@GOMEZ@ANA@ARGENTINA@03/04/1990@F@15/06/2015@00987654321@7055 @15/06/2030@421@0@ILR@UNIDAD'
+
+    def test_both_layouts_and_bad_rows(self):
+        columns = parse_barcodes([self.SHORT + '\n', 'not a barcode\n', '\n', self.LONG + '\r\n'])
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns['number'], ['12345678', '22333444    '])
+        self.assertEqual(columns['gender'], ['M', 'F'])
+        self.assertEqual(columns.bad_rows, [(2, 'not a barcode')])
+        reader = BarcodeReader(backend=MockBarcodeBackend(None))
+        self.assertEqual(list(columns.rows()), [reader._parse_barcode(self.SHORT), reader._parse_barcode(self.LONG)])
+
+    def test_chunks_from_binary_file(self):
+        source = io.BytesIO('\n'.join([self.SHORT, 'a@b', self.LONG] * 3).encode('utf-8'))
+        chunks = list(iter_barcode_chunks(source, chunk_size=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 2, 1])
+        self.assertEqual([row for chunk in chunks for row in chunk.bad_rows], [(2, 'a@b'), (5, 'a@b'), (8, 'a@b')])
+
+    def test_binary_file_left_open(self):
+        source = io.BytesIO(self.SHORT.encode('utf-8'))
+        self.assertEqual(len(parse_barcodes(source)), 1)
+        self.assertEqual(sum(len(chunk) for chunk in iter_barcode_chunks(source)), 0)
+        gc.collect()
+        self.assertFalse(source.closed)
+
+    def test_write_csv(self):
+        output = io.StringIO(newline='')
+        parse_barcodes([self.SHORT]).write_csv(output)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ['order,lastNames,names,gender,number,birthdate',
+                          '00123456789,PEREZ,JUAN CARLOS,M,12345678,01/02/1980'])
+
+
+class SidTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = MockTransport([MockResponse(status_code=200, json_data={"codigo": 0, "token": "first"}),
+                                        MockResponse(status_code=200, json_data={"codigo": 0, "dni": "1"}),
+                                        MockResponse(status_code=401, json_data={}),
+                                        MockResponse(status_code=200, json_data={"codigo": 0, "token": "second"}),
+                                        MockResponse(status_code=200, json_data={"codigo": 0, "dni": "1"})])
+        self.sid = Sid(SID, username=USERNAME, password=PASSWORD, transport=self.transport)
+
+    def test_lazy_login_and_refresh_on_rejection(self):
+        self.assertEqual(self.sid.get_basic_person_data('1', 'M')['dni'], '1')
+        self.assertEqual(self.sid.get_basic_person_data('1', 'M')['dni'], '1')
+        tokens = [call for call in self.transport.calls if call[0] == 'POST']
+        self.assertEqual(len(tokens), 2)
+        self.assertEqual(self.transport.calls[-1][2]['headers'], {"Authorization": "Bearer second"})
+
+    def test_single_token_request_between_threads(self):
+        self.transport.responses = [MockResponse(status_code=200, json_data={"codigo": 0, "token": "first"})]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = list(executor.map(lambda i: self.sid._get_valid_token(), range(8)))
+        self.assertEqual(set(tokens), {"first"})
+        self.assertEqual(len(self.transport.calls), 1)
+
+    def test_retry_on_server_error(self):
+        self.transport.responses = [MockResponse(status_code=200, json_data={"codigo": 0, "token": "first"}),
+                                    MockResponse(status_code=502, json_data={}),
+                                    MockResponse(status_code=200, json_data={"codigo": 0, "dni": "1"})]
+        self.sid._retry_policy = RetryPolicy(max_attempts=2, backoff=0)
+        self.assertEqual(self.sid.get_basic_person_data('1', 'M')['dni'], '1')
+        self.assertEqual(len(self.transport.calls), 3)
+
+
+class SidStubServerTest(unittest.TestCase):
+
+    def test_token_refresh_against_stub(self):
+        with StubServer() as server:
+            sid = Sid(server.sid_environment, username=USERNAME or 'user', password=PASSWORD or 'password')
+            self.assertEqual(sid.get_full_person_data('1', 'M', '100')['id_tramite_principal'], '100')
+            server.revoke_tokens()
+            self.assertEqual(sid.get_basic_person_data('1', 'M')['dni'], '1')
+            self.assertEqual(server.counts['CHUTROFINAL/API_ABIS/Autorizacion/token.php'], 2)
+            sid.close()
+
+    def test_single_flight(self):
+        with StubServer(latency=0.2) as server:
+            sid = Sid(server.sid_environment, username='user', password='password', single_flight=SingleFlight())
+            sid.login()
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda i: sid.get_basic_person_data('1', 'M'), range(4)))
+            self.assertEqual([result['dni'] for result in results], ['1'] * 4)
+            self.assertEqual(server.counts['apidatos/porDniSexo.php'], 1)
+            sid.close()
+
+
+class AsyncSidTest(unittest.TestCase):
+
+    def test_get_many_full_person_data(self):
+        transport = AsyncMockTransport([MockResponse(status_code=200, json_data={"codigo": 0, "token": "first"}),
+                                        MockResponse(status_code=200, json_data={"codigo": 0, "dni": "1"}),
+                                        MockResponse(status_code=200, json_data={"codigo": 1, "mensaje": "error"})])
+        sid = AsyncSid(SID, username=USERNAME, password=PASSWORD, transport=transport)
+        people = [('1', 'M', '100'), ('2', 'F', '200')]
+        results = asyncio.run(sid.get_many_full_person_data(people, concurrency=2))
+        self.assertEqual(results[0]['dni'], '1')
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(len([call for call in transport.calls if call[0] == 'POST']), 1)
@@ -0,0 +1,123 @@
+from typing import Any, Callable, Awaitable, Hashable
+from . import tracing
+import copy
+import threading
+
+
+def _copy_error(error: BaseException) -> BaseException:
+    """
+    New instance of error with the same args and attributes but no traceback, built
+    without calling __init__ since some exceptions take other constructor arguments.
+    """
+    error_type = type(error)
+    fresh = error_type.__new__(error_type, *error.args)
+    fresh.args = error.args
+    fresh.__dict__.update(vars(error))
+    return fresh
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Merges identical calls that are in flight at the same time into a single one.
+
+    The first caller of a key runs the call, callers arriving while it is running wait
+    for it and get its result (or exception) instead of sending their own request.
+    Nothing is kept once the call finishes, the next caller runs it again: this is not
+    a cache, see LookupCache for that. When a call was shared every caller gets its own
+    deep copy of the result, and waiters get their own copy of the exception, so they
+    can modify them without affecting each other. Threads use do, coroutines ado, both
+    can share the same instance.
+    coalesced counts the calls that were answered by another caller's request.
+
+        single_flight = SingleFlight()
+        renaper = Renaper(ONBOARDING, package3_apikey=key, single_flight=single_flight)
+        sid = Sid(SID, username, password, single_flight=single_flight)
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Runs func unless a call with the same key is already running, then waits for its result.
+        :(hashable) key: identifies identical calls
+        :(callable) func: zero argument callable doing the call
+        :return: func result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            with tracing.span('single_flight', tracing.WAIT):
+                call.event.wait()
+            if call.error is not None:
+                raise _copy_error(call.error) from call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        # No waiter can join once the key is removed, copy only when the result is shared.
+        return copy.deepcopy(call.result) if call.waiters else call.result
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        """
+        Asyncio version of do, func returns the awaitable doing the call.
+        Calls are merged between coroutines of the same event loop. The call runs in its own
+        task, cancelling the coroutine that started it does not cancel it for the waiters.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        key = (id(loop), key)
+        with self._lock:
+            entry = self._tasks.get(key)
+            leader = entry is None
+            if leader:
+                task = loop.create_task(func())
+                entry = self._tasks[key] = [task, 0]
+                task.add_done_callback(lambda done: self._forget(key, done))
+            else:
+                entry[1] += 1
+                self.coalesced += 1
+        task = entry[0]
+        if leader:
+            result = await asyncio.shield(task)
+            # _forget runs before the leader resumes, the waiters count is final here.
+            return copy.deepcopy(result) if entry[1] else result
+        with tracing.span('single_flight', tracing.WAIT):
+            try:
+                result = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                raise _copy_error(e) from e
+        return copy.deepcopy(result)
+
+    def _forget(self, key: Hashable, task) -> None:
+        with self._lock:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Retrieved here so a failure nobody is waiting for anymore is not logged by asyncio.
+            task.exception()
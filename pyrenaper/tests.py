@@ -1,8 +1,39 @@
 from pyrenaper.renaper import Renaper
-from pyrenaper.mocks.response import MockResponse
+from pyrenaper.async_renaper import AsyncRenaper
+from pyrenaper.batch import bulk_person_data, abulk_person_data
+from pyrenaper.body import JsonBodyStream
+from pyrenaper import codec
+from pyrenaper.cache import LookupCache, SQLiteCacheBackend
+from pyrenaper.flow import OnboardingFlow
+from pyrenaper.models import RenaperResponse, Selfie
+from pyrenaper.operations import OperationStore
+from pyrenaper.mocks.response import MockResponse, MockTransport, AsyncMockTransport
+from pyrenaper import benchmarks, loadgen, metrics, tracing
+from pyrenaper.mocks.images import document_image, selfie_image
+from pyrenaper.mocks.server import StubServer
+from pyrenaper.preload import warmup
+from pyrenaper.ratelimit import RateLimiter, SQLiteBucketStore
+from pyrenaper.retry import RetryPolicy, CircuitBreaker, is_transient, acall_with_retry
+from pyrenaper.singleflight import SingleFlight
+from pyrenaper.transport import HttpTransport
 from environments import ONBOARDING
-from exceptions import GeoBlockedRequestException, ApiKeyForPackageNotFoundException, InvalidImage
+from exceptions import GeoBlockedRequestException, ApiKeyForPackageNotFoundException, InvalidImage, \
+    InvalidLengthException, InvalidImageFormatException, ServerErrorException, CircuitOpenException, \
+    RateLimitExceededException
+from pyrenaper.images import get_jpeg_info, get_image_info, ImageCache, ImageNormalizer, RawImage
+from pyrenaper.settings import DOCUMENT_FORMAT_SETTINGS, SELFIE_FORMAT_SETTINGS
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import base64
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
 PAQUETE1_API_KEY = ''
@@ -53,6 +84,63 @@ class RenaperTest(unittest.TestCase):
         with self.assertRaises(InvalidImage) as context:
             self.renaper._validate_image(image, {})
 
+    def test_validate_image_length(self):
+        with open("mocks/front.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        with self.assertRaises(InvalidLengthException) as context:
+            self.renaper._validate_image(image, DOCUMENT_FORMAT_SETTINGS)
+
+    def test_validate_image_format(self):
+        with open("mocks/qr.png", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        with self.assertRaises(InvalidImageFormatException) as context:
+            self.renaper._validate_image(image, DOCUMENT_FORMAT_SETTINGS)
+
+    def test_prepare_raw_image_sources(self):
+        with open("mocks/front.jpg", "rb") as image_file:
+            raw = image_file.read()
+        settings = dict(DOCUMENT_FORMAT_SETTINGS, min_length=800)
+        for source in [raw, memoryview(raw), io.BytesIO(raw), pathlib.Path("mocks/front.jpg")]:
+            image = self.renaper._prepare_image(source, settings)
+            self.assertIsInstance(image, RawImage)
+            self.assertEqual(image.read(), raw)
+        with self.assertRaises(InvalidLengthException) as context:
+            self.renaper._prepare_image(pathlib.Path("mocks/front.jpg"), DOCUMENT_FORMAT_SETTINGS)
+
+    def test_validation_not_cached(self):
+        renaper = Renaper(self.environment, image_cache=ImageCache(maxsize=2))
+        with open("mocks/front.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        with self.assertRaises(InvalidLengthException) as context:
+            renaper._prepare_image(image, DOCUMENT_FORMAT_SETTINGS)
+        settings = dict(DOCUMENT_FORMAT_SETTINGS, min_length=800)
+        self.assertEqual(renaper._prepare_image(image, settings), image.decode())
+        self.assertEqual(renaper._image_cache.info, {"hits": 0, "misses": 0, "size": 0, "maxsize": 2})
+
+    def test_normalize_cache_per_normalizer(self):
+        image_cache = ImageCache()
+        high, low = ImageNormalizer(quality=95), ImageNormalizer(quality=20)
+        with open("mocks/front.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        first = Renaper(self.environment, normalizer=high, image_cache=image_cache)
+        second = Renaper(self.environment, normalizer=low, image_cache=image_cache)
+        normalized = first._normalize_images([image], DOCUMENT_FORMAT_SETTINGS)
+        self.assertEqual(first._normalize_images([image], DOCUMENT_FORMAT_SETTINGS), normalized)
+        self.assertNotEqual(second._normalize_images([image], DOCUMENT_FORMAT_SETTINGS), normalized)
+        self.assertEqual(image_cache.info, {"hits": 1, "misses": 2, "size": 2, "maxsize": image_cache.maxsize})
+        high.close()
+        low.close()
+
+    def test_normalize_selfies(self):
+        normalizer = ImageNormalizer(quality=80)
+        renaper = Renaper(self.environment, normalizer=normalizer, image_cache=ImageCache())
+        with open("mocks/selfie.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        selfies = renaper._check_selfie_format([Selfie(image, 'SN'), Selfie(image, 'SS')])
+        self.assertEqual(get_image_info(selfies[0]['file']), ('jpeg', 600, 720))
+        self.assertEqual(selfies[1]['imageType'], 'SS')
+        normalizer.close()
+
     def atest_person_data(self):
         number = ""
         gender = ""
@@ -119,3 +207,715 @@ class RenaperTest(unittest.TestCase):
         data = self.renaper.person_data(number, gender, order)
         self.assertTrue(data['status'])
         self.assertEqual(data['code_description'], 'RENAPER_OK_EXITO')
+
+    def test_transport_is_reused(self):
+        transport = MockTransport([MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"}),
+                                   MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"})])
+        renaper = Renaper(self.environment, package3_apikey='key', transport=transport)
+        renaper.person_data(1, 'M', 1)
+        renaper.person_data(2, 'M', 1)
+        self.assertEqual(len(transport.calls), 2)
+        renaper.close()
+        self.assertFalse(transport.closed)
+
+    def test_lookup_cache(self):
+        transport = MockTransport([MockResponse(status_code=400, json_data={"code": 1000}),
+                                   MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"})])
+        renaper = Renaper(self.environment, package3_apikey='key', transport=transport, lookup_cache=LookupCache())
+        self.assertFalse(renaper.person_data(1, 'M', 1).status)
+        self.assertTrue(renaper.person_data(1, 'M', 1).status)
+        data = renaper.person_data(1, 'M', 1)
+        self.assertTrue(data.status)
+        self.assertEqual(data.message, 'Exito')
+        self.assertEqual(len(transport.calls), 2)
+
+    def test_lookup_cache_skips_unsuccessful_answers(self):
+        transport = MockTransport([MockResponse(status_code=200, json_data={"code": 9220, "message": "Fallo"}),
+                                   MockResponse(status_code=200, json_data={"code": 9220, "message": "Fallo"})])
+        renaper = Renaper(self.environment, package3_apikey='key', transport=transport, lookup_cache=LookupCache())
+        renaper.person_data(1, 'M', 1)
+        renaper.person_data(1, 'M', 1)
+        self.assertEqual(len(transport.calls), 2)
+
+    def test_owned_transport_closed_by_context_manager(self):
+        with Renaper(self.environment) as renaper:
+            session = renaper._transport.session
+            self.assertIs(session, renaper._transport.session)
+        self.assertIsNone(renaper._transport._session)
+
+
+class AsyncRenaperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = AsyncMockTransport([MockResponse(status_code=200,
+                                                          json_data={"code": 901, "message": "ok", "operationId": 1}),
+                                             MockResponse(status_code=400, json_data={"code": 1000})])
+        self.renaper = AsyncRenaper(ONBOARDING, package1_apikey='key', transport=self.transport)
+
+    def test_new_operation(self):
+        data = asyncio.run(self.renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT))
+        self.assertTrue(data.status)
+        self.assertEqual(data.code_description, 'NEW_OPERATION_OK')
+        self.assertEqual(data.response['operationId'], 1)
+
+    def test_error_response(self):
+        async def run():
+            await self.renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT)
+            return await self.renaper.end_operation(1, 1, 'M')
+        data = asyncio.run(run())
+        self.assertFalse(data.status)
+        self.assertEqual(data.code_description, 'INCORRECT_PARAMETERS')
+
+    def test_invalid_image_raised_when_awaited(self):
+        with open("mocks/front.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        call = self.renaper.add_front(1, 1, 'M', image)
+        with self.assertRaises(InvalidLengthException):
+            asyncio.run(call)
+        self.assertEqual(self.transport.calls, [])
+
+    def test_images_prepared_off_event_loop(self):
+        class RecordingNormalizer(ImageNormalizer):
+            threads = []
+
+            def normalize_many(self, images, settings):
+                self.threads.append(threading.get_ident())
+                return super().normalize_many(images, settings)
+        normalizer = RecordingNormalizer()
+        renaper = AsyncRenaper(ONBOARDING, package1_apikey='key', transport=self.transport, normalizer=normalizer)
+        with open("mocks/selfie.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+
+        async def run():
+            await renaper.register(1, 'M', 1, [Selfie(image, 'SN')])
+            return threading.get_ident()
+        loop_thread = asyncio.run(run())
+        normalizer.close()
+        self.assertEqual(len(RecordingNormalizer.threads), 1)
+        self.assertNotEqual(RecordingNormalizer.threads[0], loop_thread)
+        self.assertEqual(len(self.transport.calls), 1)
+
+
+class FakeRenaper:
+    def __init__(self, failing=None, error_code=960, codes=None):
+        self.failing = failing
+        self.error_code = error_code
+        self.codes = codes or {}
+        self.calls = []
+
+    def _response(self, name, code):
+        self.calls.append(name)
+        if name == self.failing:
+            return RenaperResponse({"error": {"code": self.error_code}}, [])
+        code = self.codes.get(name, code)
+        return RenaperResponse({"code": code, "message": "ok", "operationId": 1}, [])
+
+    def new_operation(self, *args, **kwargs):
+        return self._response('new_operation', 901)
+
+    def add_front(self, *args, **kwargs):
+        return self._response('add_front', 909)
+
+    def add_back(self, *args, **kwargs):
+        return self._response('add_back', 912)
+
+    def register(self, *args, **kwargs):
+        return self._response('register', 932)
+
+    def end_operation(self, *args, **kwargs):
+        return self._response('end_operation', 903)
+
+    def person_data(self, number, gender, order, **kwargs):
+        if number == 0:
+            raise Exception("500 status code returned")
+        return self._response('person_data', 10001)
+
+
+class OnboardingFlowTest(unittest.TestCase):
+
+    def test_run(self):
+        result = OnboardingFlow(FakeRenaper()).run(1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertTrue(result.status)
+        self.assertEqual(result.operation_id, 1)
+        self.assertEqual(set(result.timings), {'new_operation', 'add_front', 'add_back', 'register', 'end_operation'})
+
+    def test_run_stops_on_failure(self):
+        renaper = FakeRenaper(failing='add_back')
+        result = OnboardingFlow(renaper).run(1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertFalse(result.status)
+        self.assertEqual(result.failed_step, 'add_back')
+        self.assertNotIn('end_operation', renaper.calls)
+
+    def test_resume_skips_completed_steps(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'operations.sqlite')
+            store = OperationStore(SQLiteCacheBackend(path))
+            result = OnboardingFlow(FakeRenaper(failing='register'), store=store).run(
+                1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+            self.assertEqual(result.failed_step, 'register')
+
+            renaper = FakeRenaper()
+            result = OnboardingFlow(renaper, store=OperationStore(SQLiteCacheBackend(path))).run(
+                1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+            self.assertTrue(result.status)
+            self.assertEqual(result.operation_id, 1)
+            self.assertEqual(renaper.calls, ['register', 'end_operation'])
+            self.assertEqual(sorted(result.resumed), ['add_back', 'add_front', 'new_operation'])
+            self.assertEqual(result.steps['add_front'].response.code, 909)
+
+    def test_completed_operation_is_not_resumed(self):
+        store = OperationStore()
+        for _ in range(2):
+            renaper = FakeRenaper()
+            result = OnboardingFlow(renaper, store=store).run(1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+            self.assertTrue(result.status)
+            self.assertEqual(result.resumed, [])
+            self.assertEqual(renaper.calls[0], 'new_operation')
+            self.assertEqual(len(renaper.calls), 5)
+        self.assertIsNone(store.get(1, 'M', TEST_FINGERPRINT))
+
+    def test_not_ok_code_is_not_resumed(self):
+        store = OperationStore()
+        result = OnboardingFlow(FakeRenaper(codes={'add_front': 964}), store=store).run(
+            1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertEqual(result.failed_step, 'add_front')
+        self.assertTrue(result.steps['add_front'].response.status)
+        self.assertNotIn('add_front', store.get(1, 'M', TEST_FINGERPRINT)['steps'])
+
+        renaper = FakeRenaper()
+        result = OnboardingFlow(renaper, store=store).run(1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertTrue(result.status)
+        self.assertIn('add_front', renaper.calls)
+        self.assertNotIn('add_front', result.resumed)
+
+    def test_expired_operation_is_dropped(self):
+        store = OperationStore()
+        OnboardingFlow(FakeRenaper(failing='register'), store=store).run(
+            1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertIsNotNone(store.get(1, 'M', TEST_FINGERPRINT))
+        OnboardingFlow(FakeRenaper(failing='register', error_code=952), store=store).run(
+            1, 'M', '127.0.0.1', TEST_FINGERPRINT, 'front', 'back', [])
+        self.assertIsNone(store.get(1, 'M', TEST_FINGERPRINT))
+
+
+class ImageInfoTest(unittest.TestCase):
+
+    def test_jpeg_header(self):
+        with open("mocks/selfie.jpg", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        self.assertEqual(get_jpeg_info(image), ('jpeg', 300, 376))
+        self.assertEqual(get_jpeg_info(image.decode()), ('jpeg', 300, 376))
+
+    def test_non_jpeg_falls_back_to_pillow(self):
+        with open("mocks/qr.png", "rb") as image_file:
+            image = base64.b64encode(image_file.read())
+        self.assertIsNone(get_jpeg_info(image))
+        self.assertEqual(get_image_info(image), ('png', 234, 117))
+
+
+class BulkPersonDataTest(unittest.TestCase):
+
+    def test_bulk_person_data(self):
+        renaper = FakeRenaper()
+        progress = []
+        items = iter([(1, 'M', 1), (2, 'F', 1), ('1', 'm', '1'), (0, 'M', 1)])
+        results = list(bulk_person_data(renaper, items, concurrency=2, on_progress=progress.append))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(renaper.calls.count('person_data'), 2)
+        errors = [result for result in results if result.error]
+        self.assertEqual([result.key for result in errors], [(0, 'M', 1)])
+        self.assertEqual(progress[-1].completed, 3)
+        self.assertEqual(progress[-1].failed, 1)
+        self.assertEqual(progress[-1].duplicates, 1)
+
+    def test_bulk_person_data_malformed_items(self):
+        renaper = FakeRenaper()
+        items = [(1, 'M'), (2, 'F', 1), None, (3, None, 1)]
+        results = list(bulk_person_data(renaper, items, concurrency=None))
+        self.assertEqual(len(results), 4)
+        errors = {result.key: result.error for result in results if result.error}
+        self.assertEqual(set(errors), {(1, 'M'), None, (3, None, 1)})
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors.values()))
+        self.assertEqual(renaper.calls, ['person_data'])
+
+    def test_abulk_person_data_malformed_items(self):
+        class AsyncFakeRenaper(FakeRenaper):
+            async def person_data(self, number, gender, order, **kwargs):
+                return super().person_data(number, gender, order)
+
+        async def run():
+            return [result async for result in abulk_person_data(AsyncFakeRenaper(), [(1, 'M'), (2, 'F', 1)])]
+        results = asyncio.run(run())
+        self.assertEqual(sorted(result.error is None for result in results), [False, True])
+
+
+class RenaperResponseTest(unittest.TestCase):
+
+    def test_lazy_decoding(self):
+        data = {"code": 903, "message": "ok",
+                "person": json.dumps({"names": "JOHN"}),
+                "ocr": {"extra": {"mrz": json.dumps({"line": 1}), "additional": ""}}}
+        raw = json.dumps(data)
+        response = RenaperResponse(data, ['END_OPERATION_OK'])
+        self.assertEqual(response.code_description, 'END_OPERATION_OK')
+        self.assertEqual(response.person, {"names": "JOHN"})
+        self.assertEqual(response.get('ocr', 'extra', 'mrz'), {"line": 1})
+        self.assertEqual(response.response['ocr']['extra']['mrz'], {"line": 1})
+        self.assertNotIn('code', response.response)
+        self.assertEqual(json.dumps(response.raw), raw)
+
+    def test_error(self):
+        response = RenaperResponse({"error": {"code": 960, "message": "invalid"}}, [])
+        self.assertFalse(response.status)
+        self.assertEqual(response.code_description, 'IMAGE_NOT_VALID')
+        self.assertEqual(response.response, {"message": "invalid"})
+
+    def test_slots(self):
+        response = RenaperResponse({"code": 901, "message": "ok"}, [])
+        with self.assertRaises(AttributeError) as context:
+            response.extra = True
+
+
+class CodecTest(unittest.TestCase):
+
+    def tearDown(self):
+        codec.use()
+
+    def test_fallback_to_stdlib(self):
+        class MissingCodec:
+            def __init__(self):
+                raise ImportError
+        codec.CODECS['missing'] = MissingCodec
+        try:
+            self.assertEqual(codec.use('missing').name, 'json')
+        finally:
+            del codec.CODECS['missing']
+        self.assertEqual(codec.loads(codec.dumps({"file": "a/b+c="})), {"file": "a/b+c="})
+
+    def test_unknown_codec(self):
+        selected = codec.get_codec()
+        with self.assertRaises(ValueError):
+            codec.use('simplejson')
+        self.assertIs(codec.get_codec(), selected)
+
+    def test_backends_roundtrip(self):
+        payload = {"operationId": 1, "selfieList": [{"file": "a/b+c=", "imageType": "SN"}]}
+        for name in codec.CODECS:
+            selected = codec.use(name)
+            self.assertEqual(selected.loads(selected.dumps(payload)), payload)
+
+
+class JsonBodyStreamTest(unittest.TestCase):
+
+    def test_streamed_body(self):
+        with open("mocks/selfie.jpg", "rb") as image_file:
+            raw = image_file.read()
+        payload = {"operationId": 1,
+                   "selfieList": [{"file": RawImage(pathlib.Path("mocks/selfie.jpg")), "imageType": "SN"}]}
+        body = JsonBodyStream(payload, chunk_size=3 * 1024)
+        data = b''
+        while True:
+            chunk = body.read(1000)
+            if not chunk:
+                break
+            data += chunk
+        self.assertEqual(len(data), len(body))
+        decoded = json.loads(data)
+        self.assertEqual(base64.b64decode(decoded["selfieList"][0]["file"]), raw)
+        self.assertEqual(decoded["operationId"], 1)
+
+
+class LookupCacheTest(unittest.TestCase):
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            cache = LookupCache(SQLiteCacheBackend(path, max_entries=2), ttl=60)
+            for number in range(3):
+                cache.set('person', {"number": number}, {"code": 10001, "number": number})
+            other_process_cache = LookupCache(SQLiteCacheBackend(path), ttl=60)
+            self.assertIsNone(other_process_cache.get('person', {"number": 0}))
+            self.assertEqual(other_process_cache.get('person', {"number": 2}), {"code": 10001, "number": 2})
+
+    def test_ttl(self):
+        cache = LookupCache(ttl=0.01)
+        cache.set('person', {"number": 1}, {"code": 10001})
+        self.assertIsNotNone(cache.get('person', {"number": 1}))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('person', {"number": 1}))
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, backoff=0)
+
+    def test_transient_errors(self):
+        import requests
+        self.assertTrue(is_transient(requests.ConnectionError()))
+        self.assertTrue(is_transient(requests.Timeout()))
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertTrue(is_transient(ServerErrorException()))
+        self.assertFalse(is_transient(FileNotFoundError()))
+        self.assertFalse(is_transient(PermissionError()))
+
+    def test_retry_idempotent_request(self):
+        transport = MockTransport([MockResponse(status_code=503, json_data={}),
+                                   MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"})])
+        renaper = Renaper(ONBOARDING, package3_apikey='key', transport=transport, retry_policy=self.policy)
+        self.assertTrue(renaper.person_data(1, 'M', 1).status)
+        self.assertEqual(len(transport.calls), 2)
+
+    def test_no_retry_for_new_operation(self):
+        transport = MockTransport([MockResponse(status_code=503, json_data={}),
+                                   MockResponse(status_code=200, json_data={"code": 901, "operationId": 1})])
+        renaper = Renaper(ONBOARDING, package1_apikey='key', transport=transport, retry_policy=self.policy)
+        with self.assertRaises(ServerErrorException):
+            renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT)
+        self.assertEqual(len(transport.calls), 1)
+
+    def test_retry_timeout(self):
+        import requests
+        with StubServer(endpoints={'information/personData': {"latency": 0.5}}) as server:
+            transport = HttpTransport(read_timeout=0.1)
+            renaper = Renaper(server.onboarding_environment, package3_apikey='key', transport=transport,
+                              retry_policy=RetryPolicy(max_attempts=2, backoff=0))
+            with self.assertRaises(requests.Timeout):
+                renaper.person_data(1, 'M', 1)
+            transport.close()
+            self.assertEqual(server.counts['information/personData'], 2)
+
+    def test_circuit_breaker(self):
+        transport = MockTransport([MockResponse(status_code=500, json_data={}) for _ in range(2)])
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        renaper = Renaper(ONBOARDING, package3_apikey='key', transport=transport,
+                          retry_policy=self.policy, circuit_breaker=breaker)
+        with self.assertRaises(CircuitOpenException):
+            renaper.person_data(1, 'M', 1)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(len(transport.calls), 2)
+
+    def test_circuit_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenException):
+            breaker.before_call()
+        time.sleep(0.02)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenException):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_cancelled_trial_releases_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        async def hang():
+            await asyncio.sleep(60)
+
+        async def ok():
+            return True
+
+        async def run():
+            trial = asyncio.ensure_future(acall_with_retry(hang, self.policy, breaker))
+            await asyncio.sleep(0)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+            return await acall_with_retry(ok, self.policy, breaker)
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(breaker.state, 'closed')
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_try_acquire(self):
+        limiter = RateLimiter({1: {"rate": 1, "capacity": 2}})
+        self.assertTrue(limiter.try_acquire(1))
+        self.assertTrue(limiter.try_acquire(1))
+        self.assertFalse(limiter.try_acquire(1))
+        self.assertTrue(limiter.try_acquire(3))
+
+    def test_acquire_waits_for_refill(self):
+        limiter = RateLimiter({1: {"rate": 50, "capacity": 1}})
+        limiter.acquire(1)
+        start = time.monotonic()
+        limiter.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        with self.assertRaises(RateLimitExceededException):
+            limiter.acquire(1, timeout=0)
+
+    def test_aacquire(self):
+        limiter = RateLimiter({2: {"rate": 50, "capacity": 1}})
+        async def run():
+            await limiter.aacquire(2)
+            await limiter.aacquire(2)
+        asyncio.run(run())
+        self.assertFalse(limiter.try_acquire(2))
+
+    def test_aacquire_shared_store_off_event_loop(self):
+        class RecordingStore:
+            threads = []
+
+            def take(self, key, rate, capacity, tokens=1):
+                self.threads.append(threading.get_ident())
+                return 0.0
+        limiter = RateLimiter({2: {"rate": 50}}, store=RecordingStore())
+
+        async def run():
+            await limiter.aacquire(2)
+            return threading.get_ident()
+        loop_thread = asyncio.run(run())
+        self.assertEqual(len(RecordingStore.threads), 1)
+        self.assertNotEqual(RecordingStore.threads[0], loop_thread)
+
+    def test_sqlite_store_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'limits.sqlite')
+            first = RateLimiter({3: {"rate": 0.1, "capacity": 1}}, store=SQLiteBucketStore(path))
+            other_process = RateLimiter({3: {"rate": 0.1, "capacity": 1}}, store=SQLiteBucketStore(path))
+            self.assertTrue(first.try_acquire(3))
+            self.assertFalse(other_process.try_acquire(3))
+
+    def test_limit_checked_before_upload(self):
+        transport = MockTransport([MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"})])
+        limiter = RateLimiter({3: {"rate": 0.1, "capacity": 1}}, timeout=0)
+        renaper = Renaper(ONBOARDING, package3_apikey='key', transport=transport, rate_limiter=limiter)
+        self.assertTrue(renaper.person_data(1, 'M', 1).status)
+        with self.assertRaises(RateLimitExceededException):
+            renaper.person_data(2, 'M', 1)
+        self.assertEqual(len(transport.calls), 1)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics.InMemoryMetrics()
+
+    def test_request_metrics(self):
+        transport = MockTransport([MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"}),
+                                   MockResponse(status_code=400, json_data={"code": 1000})])
+        renaper = Renaper(ONBOARDING, package3_apikey='key', transport=transport, metrics=self.metrics)
+        renaper.person_data(1, 'M', 1)
+        renaper.person_data(2, 'M', 1)
+        labels = {"endpoint": "information/personData", "package": 3}
+        self.assertEqual(self.metrics.get_histogram(metrics.REQUEST_DURATION, **labels).count, 2)
+        self.assertEqual(self.metrics.get_counter(metrics.HTTP_RESPONSES, status=400, **labels), 1)
+        self.assertEqual(self.metrics.get_counter(metrics.API_CODES, code='RENAPER_OK_EXITO', **labels), 1)
+        self.assertEqual(self.metrics.get_counter(metrics.API_CODES, code='INCORRECT_PARAMETERS', **labels), 1)
+
+    def test_exception_and_validation_metrics(self):
+        renaper = Renaper(ONBOARDING, transport=MockTransport([]), metrics=self.metrics)
+        with self.assertRaises(ApiKeyForPackageNotFoundException):
+            renaper.person_data(1, 'M', 1)
+        self.assertEqual(self.metrics.get_counter(metrics.EXCEPTIONS, endpoint="information/personData", package=3,
+                                                  exception='ApiKeyForPackageNotFoundException'), 1)
+        with open("mocks/selfie.jpg", "rb") as image_file:
+            selfie = Selfie(image_file.read(), 'SN')
+        renaper = Renaper(ONBOARDING, package1_apikey='key', transport=MockTransport([]), metrics=self.metrics)
+        with self.assertRaises(InvalidLengthException):
+            renaper.register(1, 'M', 1, [selfie])
+        labels = {"endpoint": "onboarding/register", "package": 1}
+        self.assertEqual(self.metrics.get_histogram(metrics.VALIDATION_DURATION, image='selfie', valid=False,
+                                                    **labels).count, 1)
+        self.assertEqual(self.metrics.get_counter(metrics.EXCEPTIONS, exception='InvalidLengthException', **labels), 1)
+
+    def test_prometheus_text(self):
+        self.metrics.increment(metrics.HTTP_RESPONSES, {"endpoint": 'status', "package": 1, "status": 200})
+        self.metrics.observe(metrics.REQUEST_DURATION, {"endpoint": 'status', "package": 1}, 0.2)
+        text = self.metrics.to_prometheus()
+        self.assertIn('# TYPE pyrenaper_http_responses_total counter', text)
+        self.assertIn('pyrenaper_http_responses_total{endpoint="status",package="1",status="200"} 1', text)
+        self.assertIn('pyrenaper_request_duration_seconds_bucket{endpoint="status",package="1",le="0.1"} 0', text)
+        self.assertIn('pyrenaper_request_duration_seconds_bucket{endpoint="status",package="1",le="0.25"} 1', text)
+        self.assertIn('pyrenaper_request_duration_seconds_count{endpoint="status",package="1"} 1', text)
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+        self.transport = MockTransport([MockResponse(status_code=200,
+                                                     json_data={"code": 901, "message": "ok", "operationId": 7}),
+                                        MockResponse(status_code=200, json_data={"code": 10001, "message": "Exito"})])
+        self.renaper = Renaper(ONBOARDING, package1_apikey='key', package3_apikey='key',
+                               transport=self.transport, tracer=self.tracer)
+
+    def test_in_memory_exporter_is_bounded(self):
+        tracer = tracing.Tracer(tracing.InMemoryExporter(max_spans=3))
+        for i in range(5):
+            with tracer.span('step{}'.format(i)):
+                pass
+        self.assertEqual([span.name for span in tracer.exporter.get_spans()], ['step2', 'step3', 'step4'])
+
+    def test_operation_span(self):
+        with self.tracer.span('onboarding') as operation:
+            self.renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT)
+            self.renaper.person_data(1, 'M', 1)
+        spans = {span.name: span for span in self.tracer.exporter.get_spans()}
+        self.assertEqual(operation.attributes['operation_id'], 7)
+        self.assertIs(spans['new_operation'].parent, operation)
+        self.assertEqual(spans['new_operation'].attributes['renaper.code'], 901)
+        self.assertEqual(len(self.tracer.exporter.get_spans(operation.trace_id)), 9)
+        self.assertEqual({span.kind for span in self.tracer.exporter.get_spans() if span.parent is not None
+                          and span.parent.name == 'person_data'}, {tracing.LOCAL, tracing.NETWORK})
+        self.assertGreater(self.tracer.exporter.breakdown(operation.trace_id)[tracing.NETWORK], 0)
+
+    def test_otel_export(self):
+        self.renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT)
+        spans = self.tracer.exporter.get_spans()
+        request = [span for span in spans if span.name == 'request'][0]
+        otel = request.to_otel()
+        self.assertEqual(otel['kind'], 3)
+        self.assertEqual(otel['parentSpanId'], request.parent.span_id)
+        self.assertIn({"key": "http.status_code", "value": {"intValue": "200"}}, otel['attributes'])
+        payload = self.tracer.otlp_payload(spans)
+        self.assertEqual(len(payload['resourceSpans'][0]['scopeSpans'][0]['spans']), len(spans))
+
+    def test_async_step_span(self):
+        renaper = AsyncRenaper(ONBOARDING, package1_apikey='key', tracer=self.tracer,
+                               transport=AsyncMockTransport(self.transport.responses))
+        asyncio.run(renaper.new_operation(1, 'M', '127.0.0.1', TEST_FINGERPRINT))
+        spans = {span.name: span for span in self.tracer.exporter.get_spans()}
+        self.assertIs(spans['request'].parent, spans['new_operation'])
+        self.assertEqual(spans['new_operation'].attributes['operation_id'], 7)
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_benchmarks_run(self):
+        for name in benchmarks.BENCHMARKS:
+            benchmarks.BENCHMARKS[name]()()
+        results = benchmarks.run(['parse_barcode_short'], repeat=2, min_time=0.001)
+        self.assertGreater(results['benchmarks']['parse_barcode_short']['min'], 0)
+        self.assertEqual(codec.loads(codec.dumps(results)), results)
+
+    def test_compare(self):
+        baseline = {"benchmarks": {"a": {"min": 1.0}, "b": {"min": 1.0}}}
+        results = {"benchmarks": {"a": {"min": 1.5}, "b": {"min": 1.1}, "c": {"min": 1.0}}}
+        comparison = benchmarks.compare(results, baseline, threshold=0.2)
+        self.assertEqual([(entry['name'], entry['regression']) for entry in comparison], [('a', True), ('b', False)])
+
+
+class StubServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(endpoints={'information/personData': {"status_code": 444}}).start()
+        self.renaper = Renaper(self.server.onboarding_environment, package1_apikey='key', package3_apikey='key')
+
+    def tearDown(self):
+        self.renaper.close()
+        self.server.stop()
+
+    def test_onboarding_flow(self):
+        document = RawImage(document_image())
+        result = OnboardingFlow(self.renaper).run(1, 'M', '127.0.0.1', TEST_FINGERPRINT, document, document,
+                                                  [Selfie(selfie_image(), 'SN')])
+        self.assertTrue(result.status)
+        self.assertEqual(result.operation_id, 1)
+        self.assertEqual(self.server.counts['onboarding/register'], 1)
+
+    def test_configured_status_code(self):
+        with self.assertRaises(GeoBlockedRequestException):
+            self.renaper.person_data(1, 'M', 1)
+
+    def test_load_generator(self):
+        operation = loadgen.SCENARIOS['face_login'](self.server.onboarding_environment, self.server.sid_environment,
+                                                    HttpTransport(), RetryPolicy())
+        results = loadgen.run_load(operation, operations=10, concurrency=2)
+        self.assertEqual(results['succeeded'], 10)
+        self.assertLessEqual(results['latency']['p50'], results['latency']['p99'])
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_threads_share_one_call(self):
+        single_flight, calls = SingleFlight(), []
+
+        def lookup():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"number": 1}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda i: single_flight.do('key', lookup), range(4)))
+        self.assertEqual(results, [{"number": 1}] * 4)
+        self.assertEqual(len({id(result) for result in results}), 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.coalesced, 3)
+        single_flight.do('key', lookup)
+        self.assertEqual(len(calls), 2)
+
+    def test_coroutines_share_one_call_and_error(self):
+        single_flight, calls = SingleFlight(), []
+
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise ServerErrorException()
+
+        async def run():
+            return await asyncio.gather(*(single_flight.ado('key', lookup) for _ in range(3)),
+                                        return_exceptions=True)
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ServerErrorException) for result in results))
+        self.assertEqual(len({id(result) for result in results}), 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_threads_get_their_own_exception(self):
+        single_flight = SingleFlight()
+
+        def lookup():
+            time.sleep(0.2)
+            raise InvalidLengthException(1, 2, 3)
+
+        def call(i):
+            try:
+                single_flight.do('key', lookup)
+            except InvalidLengthException as e:
+                return e
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            errors = list(executor.map(call, range(3)))
+        self.assertEqual(len({id(error) for error in errors}), 3)
+        self.assertTrue(all(str(error) == str(errors[0]) for error in errors))
+
+    def test_person_data_against_stub(self):
+        with StubServer(latency=0.2) as server:
+            renaper = Renaper(server.onboarding_environment, package3_apikey='key', single_flight=SingleFlight())
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                responses = list(executor.map(lambda i: renaper.person_data(1, 'M', '00123456789'), range(4)))
+            renaper.close()
+        self.assertTrue(all(response.status for response in responses))
+        self.assertEqual(server.counts['information/personData'], 1)
+
+
+class ImportTimeTest(unittest.TestCase):
+    HEAVY_MODULES = ('PIL', 'requests', 'httpx', 'zxingcpp', 'zxing', 'asyncio', 'sqlite3', 'concurrent.futures')
+    # Cumulative microseconds spent importing the clients, measured with -X importtime.
+    IMPORT_TIME_BUDGET = 150000
+
+    def _python(self, *args):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return subprocess.run([sys.executable] + list(args), env=env, capture_output=True, text=True, check=True)
+
+    def test_heavy_modules_loaded_lazily(self):
+        output = self._python('-c', 'import sys, pyrenaper; pyrenaper.Renaper, pyrenaper.Sid; '
+                                    'print(" ".join(sorted(sys.modules)))').stdout.split()
+        self.assertEqual([module for module in self.HEAVY_MODULES if module in output], [])
+
+    def test_import_time_budget(self):
+        timings = []
+        for _ in range(3):
+            stderr = self._python('-X', 'importtime', '-c', 'import pyrenaper.renaper, pyrenaper.sid').stderr
+            total = 0
+            for line in stderr.splitlines():
+                parts = line.split('|')
+                if len(parts) == 3 and parts[2].startswith(' pyrenaper') and parts[1].strip().isdigit():
+                    total += int(parts[1])
+            timings.append(total)
+        self.assertLess(min(timings), self.IMPORT_TIME_BUDGET)
+
+    def test_warmup(self):
+        timings = warmup(Renaper(ONBOARDING))
+        self.assertEqual(set(timings), {'codec', 'http', 'images', 'transport'})
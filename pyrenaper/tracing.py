@@ -0,0 +1,240 @@
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional, Dict, List
+from . import codec
+from .settings import TRACING_SETTINGS
+import os
+import threading
+import time
+
+INTERNAL = 'internal'
+LOCAL = 'local'
+NETWORK = 'network'
+WAIT = 'wait'
+
+# OpenTelemetry SpanKind values, network spans are client calls to the RENAPER API.
+OTEL_KINDS = {INTERNAL: 1, LOCAL: 1, WAIT: 1, NETWORK: 3}
+
+_current_span = ContextVar('pyrenaper_current_span', default=None)
+
+
+class Span:
+    """A timed unit of work.
+
+    kind tells local CPU work (LOCAL: image decoding, validation, JSON encoding, barcode
+    decoding) apart from time spent waiting on the API (NETWORK) or on a rate limiter (WAIT).
+    Operation and step spans use INTERNAL.
+    """
+
+    def __init__(self, tracer, name: str, kind: str = INTERNAL, parent: Optional['Span'] = None,
+                 attributes: Optional[Dict] = None) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.error = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self._start = time.perf_counter()
+        self.duration = None
+
+    @property
+    def parent_id(self) -> Optional[str]:
+        return self.parent.span_id if self.parent is not None else None
+
+    def set_attribute(self, key: str, value) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def end(self, exception: Optional[Exception] = None) -> None:
+        if self.end_time is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.end_time = self.start_time + int(self.duration * 1e9)
+        if exception is not None:
+            self.error = '{}: {}'.format(type(exception).__name__, exception)
+        self.tracer.exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+
+    def to_event(self) -> Dict:
+        """
+        :(dict) return: span as a flat structured event.
+        """
+        return {"name": self.name,
+                "kind": self.kind,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "start": self.start_time / 1e9,
+                "duration": self.duration,
+                "attributes": self.attributes,
+                "error": self.error}
+
+    def to_otel(self) -> Dict:
+        """
+        :(dict) return: span in the OTLP/JSON format accepted by OpenTelemetry collectors.
+        """
+        span = {"traceId": self.trace_id,
+                "spanId": self.span_id,
+                "name": self.name,
+                "kind": OTEL_KINDS[self.kind],
+                "startTimeUnixNano": str(self.start_time),
+                "endTimeUnixNano": str(self.end_time),
+                "attributes": [_otel_attribute(key, value)
+                               for key, value in dict(self.attributes, **{"pyrenaper.kind": self.kind}).items()],
+                "status": {"code": 2, "message": self.error} if self.error else {"code": 1}}
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otel_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class InMemoryExporter:
+    """Keeps the last max_spans finished spans in memory, the default Tracer exporter.
+    Older spans are dropped, use it for tests and debugging and a LoggingExporter or
+    OTLP export in long running services."""
+
+    def __init__(self, max_spans: Optional[int] = None) -> None:
+        self.spans = deque(maxlen=max_spans if max_spans is not None else TRACING_SETTINGS['max_spans'])
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def get_spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if trace_id is None or span.trace_id == trace_id]
+
+    def events(self, trace_id: Optional[str] = None) -> List[Dict]:
+        return [span.to_event() for span in self.get_spans(trace_id)]
+
+    def breakdown(self, trace_id: Optional[str] = None) -> Dict[str, float]:
+        """
+        Adds up the time spent by kind of work.
+        :(str) trace_id: only count spans of this trace
+        :(dict) return: seconds spent on local, network and wait spans.
+        """
+        totals = {LOCAL: 0.0, NETWORK: 0.0, WAIT: 0.0}
+        for span in self.get_spans(trace_id):
+            if span.kind in totals:
+                totals[span.kind] += span.duration
+        return totals
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+class LoggingExporter:
+    """Logs every finished span as a JSON structured event."""
+
+    def __init__(self, logger: Optional['logging.Logger'] = None, level: Optional[int] = None) -> None:
+        import logging
+        self.logger = logger or logging.getLogger('pyrenaper.tracing')
+        self.level = level if level is not None else logging.INFO
+
+    def export(self, span: Span) -> None:
+        self.logger.log(self.level, codec.dumps(span.to_event()).decode('utf-8'))
+
+
+class Tracer:
+    """Creates spans and hands them to an exporter when they end.
+
+    Any object with an export(span) method can be used as exporter.
+
+        tracer = Tracer()
+        renaper = Renaper(ONBOARDING, package1_apikey=KEY, tracer=tracer)
+        with tracer.span('onboarding'):
+            ...
+        tracer.exporter.breakdown()
+    """
+
+    def __init__(self, exporter=None, service_name: str = 'pyrenaper') -> None:
+        self.exporter = exporter if exporter is not None else InMemoryExporter()
+        self.service_name = service_name
+
+    def span(self, name: str, kind: str = INTERNAL, **attributes) -> Span:
+        """
+        Creates a span, child of the current span. Use it as a context manager to make it
+        current while the block runs, or call end on it.
+        """
+        return Span(self, name, kind, _current_span.get(), attributes)
+
+    def otlp_payload(self, spans: List[Span]) -> Dict:
+        """
+        :(list) spans: finished spans
+        :(dict) return: OTLP/JSON ExportTraceServiceRequest, POST it to a collector /v1/traces.
+        """
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otel_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "pyrenaper"},
+                            "spans": [span.to_otel() for span in spans]}]}]}
+
+
+class _NoopSpan:
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def end(self, exception: Optional[Exception] = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def activate(span):
+    """
+    Makes span the current span without ending it, returns a token for deactivate.
+    """
+    if span is NOOP_SPAN:
+        return None
+    return _current_span.set(span)
+
+
+def deactivate(token) -> None:
+    if token is not None:
+        _current_span.reset(token)
+
+
+def span(name: str, kind: str = LOCAL, tracer: Optional[Tracer] = None, **attributes):
+    """
+    Opens a child span of the current span, with tracer if there is no current span.
+    Returns a no-op span when tracing is off, so instrumented code costs a lookup.
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        return parent.tracer.span(name, kind, **attributes)
+    if tracer is not None:
+        return tracer.span(name, kind, **attributes)
+    return NOOP_SPAN
@@ -0,0 +1,151 @@
+from typing import Optional, Dict, Tuple
+from .settings import HTTP_POOL_SETTINGS
+import threading
+
+
+class HttpTransport:
+    """Pooled HTTP transport shared by Renaper and Sid clients.
+
+    Wraps a single requests.Session whose adapters keep up to pool_maxsize
+    connections open per host, so consecutive calls reuse the same TCP/TLS
+    connection instead of paying a new handshake on every request.
+    The session is created lazily and can be shared between threads, requests
+    itself is only imported when the first session is built.
+    Every request gets the connect_timeout and read_timeout seconds of HTTP_POOL_SETTINGS
+    unless a timeout is passed explicitly, a hung server raises requests.Timeout.
+    """
+
+    def __init__(self,
+                 pool_connections: Optional[int] = None,
+                 pool_maxsize: Optional[int] = None,
+                 keep_alive: Optional[bool] = None,
+                 pool_block: Optional[bool] = None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None) -> None:
+        self._settings = HTTP_POOL_SETTINGS.copy()
+        for key, value in (('pool_connections', pool_connections),
+                           ('pool_maxsize', pool_maxsize),
+                           ('keep_alive', keep_alive),
+                           ('pool_block', pool_block),
+                           ('connect_timeout', connect_timeout),
+                           ('read_timeout', read_timeout)):
+            if value is not None:
+                self._settings[key] = value
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _build_session(self) -> 'requests.Session':
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._settings['pool_connections'],
+                              pool_maxsize=self._settings['pool_maxsize'],
+                              pool_block=self._settings['pool_block'])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self._settings['keep_alive']:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @property
+    def session(self) -> 'requests.Session':
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self._settings['connect_timeout'], self._settings['read_timeout']
+
+    def request(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('GET', url, **kwargs)
+
+    def close(self) -> None:
+        """
+        Closes every pooled connection. The transport can still be used
+        afterwards, a new session will be created on the next request.
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncHttpTransport:
+    """Pooled asyncio HTTP transport used by AsyncRenaper.
+
+    Backed by a lazily created httpx.AsyncClient, httpx must be installed
+    (pip install pyrenaper[async]). Pool size and timeouts follow HTTP_POOL_SETTINGS,
+    timeout (seconds or an httpx.Timeout) replaces both timeouts.
+    """
+
+    def __init__(self,
+                 pool_maxsize: Optional[int] = None,
+                 keep_alive: Optional[bool] = None,
+                 timeout=None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None) -> None:
+        self._settings = HTTP_POOL_SETTINGS.copy()
+        for key, value in (('pool_maxsize', pool_maxsize),
+                           ('keep_alive', keep_alive),
+                           ('connect_timeout', connect_timeout),
+                           ('read_timeout', read_timeout)):
+            if value is not None:
+                self._settings[key] = value
+        self._timeout = timeout
+        self._client = None
+
+    def _build_client(self):
+        import httpx
+        max_connections = self._settings['pool_maxsize']
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections if self._settings['keep_alive'] else 0)
+        timeout = self._timeout
+        if timeout is None:
+            timeout = httpx.Timeout(self._settings['read_timeout'], connect=self._settings['connect_timeout'])
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs):
+        import httpx
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+
+    async def post(self, url: str, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
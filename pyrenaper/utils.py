@@ -1,51 +1,218 @@
-from pyrenaper.exceptions import IncorrectBarcodeException, BarcodeNotFoundException
-from pyrenaper.decorators import clean_files
-from typing import Optional, Dict, List
-from PIL import Image
+from pyrenaper.exceptions import BarcodeNotFoundException, BarcodeBackendNotFoundException
+from pyrenaper.settings import BARCODE_BACKENDS, BARCODE_IMAGE_EXTENSIONS
+from pyrenaper.models import BarcodeResult
+from pyrenaper.pdf417 import parse_barcode
+from pyrenaper import tracing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, List, Iterable, Iterator, Union
 from io import BytesIO
 import base64
-import zxing
+import os
+import threading
+
+
+class ZxingCppBackend:
+    """
+    In-process PDF417 decoder based on zxing-cpp, no subprocess or temporary files involved.
+    When the default binarizer finds nothing the image is retried with a fixed threshold
+    and then at twice its size, low contrast or low resolution ID photos need either one.
+    """
+    name = 'zxingcpp'
+
+    def __init__(self):
+        import zxingcpp
+        self._zxingcpp = zxingcpp
+        self._formats = zxingcpp.BarcodeFormat.PDF417
+
+    def _read(self, image, **options) -> Optional[str]:
+        barcodes = self._zxingcpp.read_barcodes(image, formats=self._formats, **options)
+        return barcodes[0].text if barcodes else None
+
+    def decode(self, image) -> Optional[str]:
+        barcode = self._read(image)
+        if barcode is None:
+            barcode = self._read(image, binarizer=self._zxingcpp.Binarizer.FixedThreshold)
+        if barcode is None:
+            barcode = self._read(image.resize((image.width * 2, image.height * 2)))
+        return barcode
+
+
+class ZxingBackend:
+    """
+    Java zxing decoder. The reader (and its classpath lookup) is created once and reused,
+    images are handed over as in-memory buffers.
+    """
+    name = 'zxing'
+
+    def __init__(self):
+        import zxing
+        self._reader = zxing.BarCodeReader()
+
+    def decode(self, image) -> Optional[str]:
+        buffer = BytesIO()
+        image.save(buffer, format='PNG', compress_level=0)
+        buffer.seek(0)
+        barcode = self._reader.decode(buffer, possible_formats=['PDF_417'])
+        return barcode.parsed if barcode else None
+
+
+BACKENDS = {ZxingCppBackend.name: ZxingCppBackend,
+            ZxingBackend.name: ZxingBackend}
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend():
+    """
+    Returns the shared barcode backend, created on first use following BARCODE_BACKENDS preference.
+    """
+    global _default_backend
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                _default_backend = _load_backend(BARCODE_BACKENDS)
+    return _default_backend
+
+
+def _load_backend(names: List[str]):
+    for name in names:
+        try:
+            return BACKENDS[name]()
+        except ImportError:
+            continue
+    raise BarcodeBackendNotFoundException
+
 
 class BarcodeReader:
+    """
+    Decodes Argentina's ID PDF417 barcodes.
+    :backend: object with a decode(PIL.Image) -> Optional[str] method, or a name in BACKENDS.
+    Defaults to a shared backend kept warm between calls.
+    """
+
+    def __init__(self, backend=None):
+        if isinstance(backend, str):
+            backend = _load_backend([backend])
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_default_backend()
+        return self._backend
 
     def _parse_barcode(self, barcode: str) -> Dict:
         """
         Parses Document data from ID PDF417 QR code.
-        :(base64 img) barcode: Front/Back or simple image of Document ID Barcode.
+        :(str) barcode: decoded payload of the Document ID Barcode.
         :return: Parsed payload
         """
-        barcode_data = barcode.split('@')
-        if 8 <= len(barcode_data) <= 9:
-            data = {"order": barcode_data[0],
-                    "lastNames": barcode_data[1],
-                    "names": barcode_data[2],
-                    "gender": barcode_data[3],
-                    "number": barcode_data[4],
-                    "birthdate": barcode_data[6]}
-        elif 16 <= len(barcode_data) <= 17:
-            data = {"order": barcode_data[0],
-                    "lastNames": barcode_data[4],
-                    "names": barcode_data[5],
-                    "gender": barcode_data[8],
-                    "number": barcode_data[1],
-                    "birthdate": barcode_data[7]}
-        else:
-            raise IncorrectBarcodeException
-        return data
+        return parse_barcode(barcode)
 
-    @clean_files
-    def get_barcode_payload(self, image: str, image_name: str, format: str) -> Dict:
+    def decode_bytes(self, image: bytes) -> str:
         """
-        DEPRECATED
-        Extracts information from Argentina's PDF417 Qr Code.
-        :(base64 img) image: Image containing Argentina's Government PDF417 QR Code.
-        :return:
+        Decodes the PDF417 barcode contained in raw image bytes.
+        :(bytes) image: Image containing Argentina's Government PDF417 QR Code.
+        :(str) return: Raw barcode text.
         """
-        filename = '{}.{}'.format(image_name, format)
-        np_img = Image.open(BytesIO(base64.b64decode(image)))
-        np_img.save(filename)
-        reader = zxing.BarCodeReader()
-        barcode = reader.decode(filename)
+        from PIL import Image
+        with tracing.span('barcode_decode', tracing.LOCAL):
+            barcode = self.backend.decode(Image.open(BytesIO(image)))
         if not barcode:
             raise BarcodeNotFoundException
-        return self._parse_barcode(barcode.parsed)
\ No newline at end of file
+        return barcode
+
+    def get_barcode_payload_from_bytes(self, image: bytes) -> Dict:
+        """
+        Extracts information from Argentina's PDF417 Qr Code.
+        :(bytes) image: Raw image containing Argentina's Government PDF417 QR Code.
+        :return: Parsed payload
+        """
+        return self._parse_barcode(self.decode_bytes(image))
+
+    def get_barcode_payload(self, image: str, *args) -> Dict:
+        """
+        Extracts information from Argentina's PDF417 Qr Code.
+        Extra positional arguments (image_name, format) are ignored, no files are written anymore.
+        :(base64 img) image: Image containing Argentina's Government PDF417 QR Code.
+        :return: Parsed payload
+        """
+        return self.get_barcode_payload_from_bytes(base64.b64decode(image))
+
+
+_worker_reader = None
+
+
+def _init_barcode_worker(backend) -> None:
+    global _worker_reader
+    _worker_reader = BarcodeReader(backend)
+    try:
+        _worker_reader.backend
+    except Exception:
+        pass
+
+
+def _decode_barcode_job(name: str, image: Union[str, bytes]) -> BarcodeResult:
+    try:
+        if isinstance(image, str):
+            with open(image, 'rb') as image_file:
+                image = image_file.read()
+        return BarcodeResult(name, _worker_reader.get_barcode_payload_from_bytes(image), None)
+    except Exception as e:
+        return BarcodeResult(name, None, e)
+
+
+def _barcode_jobs(source) -> Iterator:
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.isdir(source):
+            for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in BARCODE_IMAGE_EXTENSIONS:
+                    yield entry.path, entry.path
+        elif os.path.isfile(source):
+            yield os.fspath(source), os.fspath(source)
+        else:
+            raise FileNotFoundError('No such file or directory: {}'.format(os.fspath(source)))
+        return
+    for item in source:
+        if isinstance(item, (str, os.PathLike)):
+            yield str(item), str(item)
+        else:
+            yield item
+
+
+def decode_barcodes(source: Union[str, Iterable],
+                    workers: Optional[int] = None,
+                    backend=None,
+                    max_pending: Optional[int] = None) -> Iterator[BarcodeResult]:
+    """
+    Decodes PDF417 barcodes of many images spreading the work across a process pool.
+    Results are yielded as they finish, failures (BarcodeNotFoundException, IncorrectBarcodeException, ...)
+    are reported in BarcodeResult.error instead of stopping the batch.
+    :(str|iterable) source: directory with images, a single image path, or an iterable of file paths or
+    (name, raw image bytes) tuples. Missing paths raise FileNotFoundError.
+    :(int) workers: amount of worker processes, defaults to the amount of CPUs.
+    :backend: backend name (or picklable backend object) used by every worker.
+    :(int) max_pending: maximum amount of images queued at once, defaults to 4 per worker.
+    :(iterator) return: BarcodeResult(name, payload, error) objects.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    jobs = _barcode_jobs(source)
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_barcode_worker,
+                             initargs=(backend,)) as executor:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_decode_barcode_job, *job))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -32,9 +32,12 @@ setuptools.setup(
                       "toml==0.10.2",
                       "urllib3==1.26.5",
                       "coverage",
-                      "zxing"],
+                      "zxing",
+                      "zxing-cpp"],
+    extras_require={"async": ["httpx"],
+                    "fast": ["orjson"]},
     include_package_data=True,
-    packages=['pyrenaper'],
+    packages=setuptools.find_packages(),
     python_requires=">=3.8",
 )
 